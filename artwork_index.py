@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+生成插圖的感知雜湊索引
+為每張圖片保存 64 位元 dHash，以 NumPy 陣列存成單一壓縮的 .npz 檔；
+查詢近似圖片時把雜湊切成 4 段，各段排序後以二分搜尋找出至少一段完全相同的候選
+（漢明距離 ≤ 3 時必定有一段相同），不必逐一比對整個索引。
+用來找出重複的插圖、為新提示詞沿用夠相近的既有圖片，以及清除多餘的檔案
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from job_journal import JobJournal
+from resized_image_cache import image_dhash
+
+INDEX_PATH = Path("illustrations/cache/artwork_index.npz")
+GENERATED_DIR = Path("illustrations/generated")
+# 輸出庫的圖片是生成結果的逐位元組副本，可供沿用查詢，但不參與重複清除
+RENDER_OBJECTS_DIR = Path("illustrations/cache/renders/objects")
+SCAN_DIRS = (GENERATED_DIR, RENDER_OBJECTS_DIR)
+RENDER_MANIFEST = Path("illustrations/cache/renders/manifest.json")
+JOURNAL_PATH = GENERATED_DIR / "journal.jsonl"
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+# 雜湊切成的段數與每段位元數；分段索引可保證找到距離 ≤ BANDS - 1 的所有圖片
+BANDS = 4
+BAND_BITS = 64 // BANDS
+
+# 預設視為重複的漢明距離
+DUPLICATE_DISTANCE = 3
+
+# 每一列的欄位與型別
+COLUMNS = {
+    "hashes": np.uint64,
+    "widths": np.int32,
+    "heights": np.int32,
+    "mtimes": np.int64,
+    "sizes": np.int64
+}
+
+
+def popcount(values):
+    """uint64 陣列每個元素的 1 位元數"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int64)
+    bits = np.unpackbits(np.ascontiguousarray(values).view(np.uint8).reshape(-1, 8), axis=1)
+    return bits.sum(axis=1, dtype=np.int64)
+
+
+class ArtworkIndex:
+    """插圖的感知雜湊索引"""
+
+    def __init__(self, path=INDEX_PATH):
+        """初始化索引，已有索引檔時載入"""
+        self.path = Path(path)
+        self.paths = np.array([], dtype=str)
+        self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        # 各段的 (排序後的段值, 對應的列號)，索引變更後重新建立
+        self.band_index = None
+        self.dirty = False
+        self.load()
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def hashes(self):
+        return self.columns["hashes"]
+
+    def load(self):
+        """載入索引檔"""
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                self.paths = data["paths"]
+                self.columns = {name: data[name].astype(dtype) for name, dtype in COLUMNS.items()}
+        except (OSError, KeyError, ValueError):
+            pass  # 索引損毀時重新掃描
+
+    def save(self):
+        """寫回索引檔"""
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f"{self.path.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(temp_path, paths=self.paths, **self.columns)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def keep_rows(self, mask):
+        """只保留 mask 為 True 的列"""
+        self.paths = self.paths[mask]
+        self.columns = {name: values[mask] for name, values in self.columns.items()}
+        self.band_index = None
+        self.dirty = True
+
+    def scan(self, directories=SCAN_DIRS):
+        """把目錄中新增或變更的圖片加入索引，並移除已不存在的檔案，回傳新加入的數量"""
+        known = {path: row for row, path in enumerate(self.paths)}
+        stale = np.zeros(len(self), dtype=bool)
+        rows = []
+
+        for directory in directories:
+            if not Path(directory).is_dir():
+                continue
+            for path in sorted(Path(directory).rglob("*")):
+                if path.suffix.lower() not in IMAGE_SUFFIXES:
+                    continue
+                key = os.path.abspath(path)
+                stat = path.stat()
+                row = known.get(key)
+                if row is not None:
+                    if (self.columns["mtimes"][row] == stat.st_mtime_ns
+                            and self.columns["sizes"][row] == stat.st_size):
+                        continue
+                    stale[row] = True
+                try:
+                    with Image.open(path) as img:
+                        rows.append((key, image_dhash(img), img.width, img.height, stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    continue  # 寫到一半或損毀的圖片
+
+        missing = np.array([not os.path.exists(path) for path in self.paths], dtype=bool)
+        if (stale | missing).any():
+            self.keep_rows(~(stale | missing))
+
+        if rows:
+            new_paths, *new_columns = zip(*rows)
+            self.paths = np.concatenate([self.paths, np.array(new_paths, dtype=str)])
+            for (name, dtype), values in zip(COLUMNS.items(), new_columns):
+                self.columns[name] = np.concatenate([self.columns[name], np.array(values, dtype=dtype)])
+            self.band_index = None
+            self.dirty = True
+
+        return len(rows)
+
+    def bands(self, hashes):
+        """把雜湊切成 BANDS 段，回傳 (..., BANDS) 的段值"""
+        shifts = np.arange(BANDS - 1, -1, -1, dtype=np.uint64) * np.uint64(BAND_BITS)
+        return (np.asarray(hashes, dtype=np.uint64)[..., None] >> shifts) & np.uint64((1 << BAND_BITS) - 1)
+
+    def build_band_index(self):
+        """為每一段建立排序後的段值與列號"""
+        values = self.bands(self.hashes)
+        self.band_index = []
+        for band in range(BANDS):
+            order = np.argsort(values[:, band], kind="stable")
+            self.band_index.append((values[order, band], order))
+
+    def candidates(self, dhash, max_distance):
+        """可能在距離內的列號：距離 ≤ BANDS - 1 時只取至少一段相同的列，否則為全部"""
+        if max_distance >= BANDS:
+            return np.arange(len(self))
+        if self.band_index is None:
+            self.build_band_index()
+        found = []
+        for band, value in enumerate(self.bands(dhash)):
+            sorted_values, order = self.band_index[band]
+            start, end = np.searchsorted(sorted_values, value, "left"), np.searchsorted(sorted_values, value, "right")
+            found.append(order[start:end])
+        return np.unique(np.concatenate(found))
+
+    def near(self, dhash, max_distance=DUPLICATE_DISTANCE):
+        """距離 dhash 不超過 max_distance 的 [(距離, 列號)]，由近到遠排序"""
+        rows = self.candidates(dhash, max_distance)
+        distances = popcount(self.hashes[rows] ^ np.uint64(dhash))
+        keep = distances <= max_distance
+        return sorted(zip(distances[keep].tolist(), rows[keep].tolist()))
+
+    def lookup_rows(self, image_path, max_distance=DUPLICATE_DISTANCE):
+        """與圖片相近的已索引列 [(距離, 列號)]，不含圖片本身"""
+        with Image.open(image_path) as img:
+            dhash = image_dhash(img)
+        own_path = os.path.abspath(image_path)
+        return [(distance, row) for distance, row in self.near(dhash, max_distance) if self.paths[row] != own_path]
+
+    def lookup(self, image_path, max_distance=DUPLICATE_DISTANCE):
+        """與圖片相近的已索引檔案 [(距離, 路徑)]，不含圖片本身"""
+        return [(distance, str(self.paths[row])) for distance, row in self.lookup_rows(image_path, max_distance)]
+
+    def reusable(self, image_path, max_distance, min_size=(0, 0), exclude=()):
+        """可代替這張圖的既有檔案（解析度至少 min_size、距離最近、不在 exclude 中），沒有時回傳 None"""
+        exclude = {os.path.abspath(path) for path in exclude}
+        for _, row in self.lookup_rows(image_path, max_distance):
+            if self.paths[row] in exclude:
+                continue
+            if self.columns["widths"][row] >= min_size[0] and self.columns["heights"][row] >= min_size[1]:
+                return str(self.paths[row])
+        return None
+
+    def rows_under(self, directories):
+        """路徑位於任一目錄之下的列"""
+        prefixes = tuple(os.path.join(os.path.abspath(directory), "") for directory in directories)
+        return np.array([str(path).startswith(prefixes) for path in self.paths], dtype=bool)
+
+    def duplicate_groups(self, max_distance=DUPLICATE_DISTANCE, exclude_dirs=()):
+        """彼此相近（可經由其他圖片間接相連）的列號群組，只回傳兩張以上的群組
+
+        exclude_dirs 之下的圖片不列入任何群組
+        """
+        included = ~self.rows_under(exclude_dirs) if exclude_dirs else np.ones(len(self), dtype=bool)
+        parent = list(range(len(self)))
+
+        def find(row):
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for row, dhash in enumerate(self.hashes.tolist()):
+            if not included[row]:
+                continue
+            for _, other in self.near(dhash, max_distance):
+                if included[other]:
+                    parent[find(other)] = find(row)
+
+        groups = {}
+        for row in np.flatnonzero(included).tolist():
+            groups.setdefault(find(row), []).append(row)
+        return [rows for rows in groups.values() if len(rows) > 1]
+
+    def collect_garbage(self, max_distance=DUPLICATE_DISTANCE, protected=(), delete=False, exclude_dirs=()):
+        """每組重複的圖片只保留一張（解析度最高、其次最新，或受保護的檔案），回傳要刪除的路徑
+
+        受保護的檔案一律不刪除；exclude_dirs 之下的圖片不參與比對。delete 為 False 時只列出不刪除
+        """
+        protected = {os.path.abspath(path) for path in protected}
+        removed = []
+        for rows in self.duplicate_groups(max_distance, exclude_dirs):
+            keep = max(rows, key=lambda row: (
+                self.paths[row] in protected,
+                int(self.columns["widths"][row]) * int(self.columns["heights"][row]),
+                int(self.columns["mtimes"][row])
+            ))
+            removed.extend(str(self.paths[row]) for row in rows
+                           if row != keep and self.paths[row] not in protected)
+
+        if delete and removed:
+            for path in removed:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.keep_rows(~np.isin(self.paths, removed))
+        return removed
+
+
+def render_cache_objects(manifest_path=RENDER_MANIFEST):
+    """輸出庫 manifest 仍在引用的圖片，清除時不可刪除"""
+    if not Path(manifest_path).exists():
+        return []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    root = Path(manifest_path).parent
+    return [root / entry["object"] for page in manifest["pages"].values() for entry in page.values()]
+
+
+def current_outputs(journal_path=JOURNAL_PATH):
+    """任務日誌中各輸出檔最後一次完成的成品，即目前使用中的插圖，清除時不可刪除"""
+    if not Path(journal_path).exists():
+        return []
+    return [Path(path) for path in JobJournal(journal_path).latest_outputs() if os.path.exists(path)]
+
+
+def main(argv=None):
+    """主函數"""
+    parser = argparse.ArgumentParser(description="生成插圖的感知雜湊索引：找重複、查相近圖片、清除多餘檔案")
+    parser.add_argument("command", choices=["scan", "duplicates", "lookup", "gc"], help="要執行的動作")
+    parser.add_argument("image", nargs="?", help="lookup 的查詢圖片")
+    parser.add_argument("--index", default=str(INDEX_PATH), help="索引檔路徑")
+    parser.add_argument("--dirs", nargs="+", default=[str(path) for path in SCAN_DIRS], help="要索引的目錄")
+    parser.add_argument("--distance", type=int, default=DUPLICATE_DISTANCE, help="視為相近的最大漢明距離")
+    parser.add_argument("--delete", action="store_true", help="gc 時實際刪除檔案（預設只列出）")
+    parser.add_argument("--journal", default=str(JOURNAL_PATH), help="任務日誌，gc 時保留其中各輸出檔目前的成品")
+    args = parser.parse_args(argv)
+
+    index = ArtworkIndex(args.index)
+    added = index.scan(args.dirs)
+    print(f"🗂️ 索引 {len(index)} 張圖片（新增 {added} 張）")
+
+    if args.command == "duplicates":
+        groups = index.duplicate_groups(args.distance, [RENDER_OBJECTS_DIR])
+        for rows in groups:
+            print(f"🔁 {len(rows)} 張相近：")
+            for row in rows:
+                print(f"  - {index.paths[row]}")
+        print(f"📊 {len(groups)} 組重複，共 {sum(len(rows) for rows in groups)} 張")
+
+    elif args.command == "lookup":
+        if not args.image:
+            print("❌ lookup 需要指定查詢圖片")
+            return False
+        matches = index.lookup(args.image, args.distance)
+        for distance, path in matches:
+            print(f"  {distance:2d}  {path}")
+        print(f"📊 找到 {len(matches)} 張相近的圖片")
+
+    elif args.command == "gc":
+        protected = [*render_cache_objects(), *current_outputs(args.journal)]
+        removed = index.collect_garbage(args.distance, protected=protected, delete=args.delete,
+                                        exclude_dirs=[RENDER_OBJECTS_DIR])
+        for path in removed:
+            print(f"🗑️ {path}")
+        action = "已刪除" if args.delete else "可刪除（加上 --delete 實際刪除）"
+        print(f"📊 {action} {len(removed)} 張重複圖片")
+
+    index.save()
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n\n⏹️ 已取消")
+        sys.exit(1)
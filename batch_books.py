@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+多本童書的批次生成
+讀取目錄中所有書本定義檔（含翻譯版與個人化版本），在同一個程序池中排版，
+各書共用字型、樣式與插圖快取，並回報每本書的耗時
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+from book_manifest import BOOKS_DIR, load_book
+from generate_pdf_book import ChildrenBookGenerator, OUTPUT_PROFILES
+
+MANIFEST_SUFFIXES = (".json", ".yaml", ".yml")
+
+# 子程序共用的生成器（fork 時從主程序繼承已建立的樣式與快取）
+_worker_prototype = None
+
+
+def _build_title(book, output_path, options):
+    """子程序中排版一本書，回傳耗時與結果"""
+    start = time.perf_counter()
+    error = None
+    try:
+        generator = _worker_prototype.for_book(book, str(output_path))
+        # 批次中每本書的進度訊息只會洗版，改以彙總報告呈現
+        with contextlib.redirect_stdout(io.StringIO()):
+            if not generator.generate_pdf(**options):
+                error = "生成失敗"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "manifest": book.path,
+        "title": book.title,
+        "edition": book.edition,
+        "output": str(output_path),
+        "pages": len(book.pages),
+        "seconds": time.perf_counter() - start,
+        "bytes": os.path.getsize(output_path) if error is None else 0,
+        "error": error,
+        "pid": os.getpid()
+    }
+
+
+def discover_titles(books_dir, output_dir, profile=None):
+    """找出目錄中所有定義檔的所有版本，回傳 ([(書本定義, 輸出路徑)], [略過的原因])"""
+    titles = []
+    skipped = []
+    for path in sorted(Path(books_dir).iterdir()):
+        if path.suffix not in MANIFEST_SUFFIXES:
+            continue
+        try:
+            book = load_book(path)
+        except (OSError, ValueError) as e:
+            skipped.append(f"{path.name}: {e}")
+            continue
+
+        missing_images = book.missing_images()
+        if missing_images:
+            skipped.append(f"{path.name}: 缺少圖片 {', '.join(missing_images)}")
+            continue
+
+        for edition_book in book.edition_books():
+            output_name = Path(edition_book.output)
+            if profile:
+                output_name = output_name.with_name(f"{output_name.stem}-{profile}{output_name.suffix}")
+            titles.append((edition_book, Path(output_dir) / output_name.name))
+
+    return titles, skipped
+
+
+def build_titles(titles, workers, profile=None, image_cache_dir=None, page_cache_dir=None):
+    """以程序池排版所有書，回傳每本書的結果"""
+    global _worker_prototype
+
+    # 在 fork 之前建立一次樣式與快取，子程序直接繼承
+    _worker_prototype = ChildrenBookGenerator(
+        profile=profile, image_cache_dir=image_cache_dir, page_cache_dir=page_cache_dir
+    )
+    # 同一本書的各版本共用大部分頁面，增量模式可直接沿用片段；逐頁寫出讓記憶體不隨頁數增加
+    options = {"incremental": True, "streaming": True}
+
+    results = []
+    workers = max(1, min(workers, len(titles)))
+    context = multiprocessing.get_context("fork")
+    try:
+        with context.Pool(workers) as pool:
+            tasks = [pool.apply_async(_build_title, (book, output_path, options)) for book, output_path in titles]
+            for task in tasks:
+                result = task.get()
+                results.append(result)
+                name = result["title"] + (f" ({result['edition']})" if result["edition"] else "")
+                if result["error"]:
+                    print(f"❌ {name}: {result['error']}")
+                else:
+                    print(f"✅ {name}: {result['pages']} 頁，{result['seconds']:.2f} 秒 → {result['output']}")
+    finally:
+        _worker_prototype = None
+
+    return results
+
+
+def main(argv=None):
+    """主函數"""
+    parser = argparse.ArgumentParser(description="批次生成目錄中所有書本定義（含翻譯版與個人化版本）的PDF")
+    parser.add_argument("--books-dir", default=str(BOOKS_DIR), help="書本定義檔目錄")
+    parser.add_argument("--output-dir", default="build/books", help="PDF輸出目錄")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="排版程序數")
+    parser.add_argument("--profile", choices=sorted(OUTPUT_PROFILES), help="輸出設定")
+    parser.add_argument("--report", help="把每本書的耗時寫成JSON")
+    args = parser.parse_args(argv)
+
+    print("📚 童書批次生成")
+    print("=" * 50)
+
+    titles, skipped = discover_titles(args.books_dir, args.output_dir, args.profile)
+    for reason in skipped:
+        print(f"⚠️ 略過 {reason}")
+    if not titles:
+        print("❌ 沒有可生成的書本")
+        return False
+
+    Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    print(f"🧵 以 {min(args.workers, len(titles))} 個程序生成 {len(titles)} 本書")
+
+    start = time.perf_counter()
+    results = build_titles(titles, args.workers, args.profile)
+    elapsed = time.perf_counter() - start
+
+    succeeded = [result for result in results if result["error"] is None]
+    print(f"\n📊 完成 {len(succeeded)}/{len(results)} 本，共 {elapsed:.1f} 秒，"
+          f"每小時約 {len(succeeded) * 3600 / elapsed:.0f} 本")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"elapsed_seconds": elapsed, "titles": results}, f, ensure_ascii=False, indent=2)
+        print(f"📁 耗時報告：{args.report}")
+
+    return len(succeeded) == len(results)
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n\n⏹️ 已取消")
+        sys.exit(1)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+插圖生成與PDF排版的效能基準測試
+在本機建立隨機初始化的迷你 Stable Diffusion 模型，不需下載、可離線在CPU上執行
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import torch
+from diffusers import AutoencoderKL, DPMSolverMultistepScheduler, StableDiffusionPipeline, UNet2DConditionModel
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+REPO_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(REPO_DIR))
+
+from image_generation_pipeline import BubbleBookGenerator
+
+
+def bytes_to_unicode():
+    """CLIP BPE 使用的位元組對應表"""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, [chr(c) for c in cs]))
+
+
+def build_tiny_pipeline(model_dir, seed=0):
+    """建立並保存隨機初始化的迷你 pipeline（字元級 tokenizer）"""
+    model_dir = Path(model_dir)
+    vocab_dir = model_dir / "_vocab"
+    vocab_dir.mkdir(parents=True, exist_ok=True)
+
+    # 只有單字元 token、沒有合併規則的最小 BPE 詞表
+    chars = list(bytes_to_unicode().values())
+    vocab = {}
+    for c in chars + [c + "</w>" for c in chars] + ["<|startoftext|>", "<|endoftext|>"]:
+        vocab.setdefault(c, len(vocab))
+    with open(vocab_dir / "vocab.json", 'w', encoding='utf-8') as f:
+        json.dump(vocab, f)
+    (vocab_dir / "merges.txt").write_text("#version: 0.2\n", encoding='utf-8')
+
+    tokenizer = CLIPTokenizer(
+        str(vocab_dir / "vocab.json"), str(vocab_dir / "merges.txt"),
+        model_max_length=77, pad_token="<|endoftext|>"
+    )
+
+    torch.manual_seed(seed)
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=len(vocab), hidden_size=32, intermediate_size=37,
+        num_hidden_layers=2, num_attention_heads=4, max_position_embeddings=77,
+        projection_dim=32, bos_token_id=vocab["<|startoftext|>"],
+        eos_token_id=vocab["<|endoftext|>"], pad_token_id=vocab["<|endoftext|>"]
+    ))
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64), layers_per_block=1, sample_size=8,
+        in_channels=4, out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32, norm_num_groups=8, attention_head_dim=4
+    )
+    vae = AutoencoderKL(
+        block_out_channels=(8, 16), in_channels=3, out_channels=3,
+        down_block_types=("DownEncoderBlock2D",) * 2,
+        up_block_types=("UpDecoderBlock2D",) * 2,
+        latent_channels=4, norm_num_groups=8, sample_size=16
+    )
+
+    pipeline = StableDiffusionPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet,
+        scheduler=DPMSolverMultistepScheduler(), safety_checker=None,
+        feature_extractor=None, requires_safety_checker=False
+    )
+    pipeline.save_pretrained(model_dir)
+    shutil.rmtree(vocab_dir)
+    return model_dir
+
+
+def summarize(durations):
+    """把多次量測整理成統計值（秒）"""
+    return {
+        "runs": len(durations),
+        "mean_s": statistics.fmean(durations),
+        "median_s": statistics.median(durations),
+        "min_s": min(durations),
+        "max_s": max(durations)
+    }
+
+
+def time_runs(func, repeat):
+    """執行 repeat 次並回傳統計值"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def benchmark_generation(model_dir, args):
+    """量測模型載入、文字編碼、逐步去噪、VAE解碼與PNG保存"""
+    results = {}
+    generator = None
+
+    def load():
+        nonlocal generator
+        generator = BubbleBookGenerator(model_name=str(model_dir), embedding_cache_dir=None, render_cache_dir=None)
+        if not generator.load_model():
+            raise RuntimeError("迷你模型載入失敗")
+
+    results["model_load"] = time_runs(load, args.repeat)
+
+    prompts = list(generator.prompts.values())
+    texts = [f"{p['prompt']}, {generator.style_tags}" for p in prompts] + [p["negative"] for p in prompts]
+    results["text_encode"] = time_runs(lambda: [generator.encode_text(text) for text in texts], args.repeat)
+    results["text_encode"]["prompts"] = len(texts)
+
+    pipeline = generator.pipeline
+    with torch.no_grad():
+        prompt_embeds = generator.encode_text(texts[0])
+        negative_embeds = generator.encode_text(texts[len(prompts)])
+
+    # 逐步去噪：以步驟回呼記錄每一步的時間
+    step_durations = []
+    latents = None
+
+    def denoise():
+        nonlocal latents
+        marks = [time.perf_counter()]
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            marks.append(time.perf_counter())
+            return callback_kwargs
+
+        with torch.no_grad():
+            latents = pipeline(
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_embeds,
+                num_inference_steps=args.steps,
+                width=args.size,
+                height=args.size,
+                output_type="latent",
+                generator=torch.Generator("cpu").manual_seed(0),
+                callback_on_step_end=on_step_end
+            ).images
+        # 第一個區間包含準備工作，只統計步驟之間的間隔
+        step_durations.extend(b - a for a, b in zip(marks[1:], marks[2:]))
+
+    results["denoise_total"] = time_runs(denoise, args.repeat)
+    results["denoise_step"] = summarize(step_durations)
+
+    images = []
+
+    def decode():
+        images.clear()
+        with torch.no_grad():
+            decoded = pipeline.vae.decode(latents / pipeline.vae.config.scaling_factor, return_dict=False)[0]
+        images.extend(pipeline.image_processor.postprocess(decoded, output_type="pil"))
+
+    results["vae_decode"] = time_runs(decode, args.repeat)
+
+    output_path = generator.output_dir / "benchmark.png"
+    results["png_save"] = time_runs(lambda: images[0].save(output_path, "PNG", quality=95), args.repeat)
+
+    # 完整流程：一頁多個變體的批次生成
+    jobs = [generator.make_job("cover", i + 1) for i in range(args.variations)]
+    results["generate_batch"] = time_runs(
+        lambda: generator.generate_batch(jobs, args.steps, 7.5, args.size, args.size),
+        args.repeat
+    )
+    results["generate_batch"]["images_per_minute"] = args.variations * 60 / results["generate_batch"]["mean_s"]
+
+    return results
+
+
+def benchmark_pdf(args):
+    """量測整本童書的PDF排版"""
+    from generate_pdf_book import ChildrenBookGenerator
+
+    generator = ChildrenBookGenerator(output_path="benchmark_book.pdf", image_cache_dir="image_cache", image_dir=".")
+
+    # 使用倉庫中的插圖，缺少時以純色圖片代替
+    from PIL import Image as PILImage
+    for page in generator.pages:
+        source = REPO_DIR / page["image"]
+        if source.exists():
+            shutil.copyfile(source, page["image"])
+        else:
+            PILImage.new("RGB", (1024, 1024), (227, 242, 253)).save(page["image"])
+
+    result = time_runs(generator.generate_pdf, args.repeat)
+    result["pages"] = len(generator.pages)
+    result["output_bytes"] = os.path.getsize(generator.output_path)
+    return result
+
+
+def compare(results, baseline_path, tolerance):
+    """與先前的基準結果比較，列出變慢超過容許範圍的項目"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for stage, stats in results.items():
+        if stage in baseline and "mean_s" in stats:
+            ratio = stats["mean_s"] / baseline[stage]["mean_s"]
+            marker = "⚠️" if ratio > 1 + tolerance else "✅"
+            print(f"  {marker} {stage}: {ratio:.2f}x")
+            if ratio > 1 + tolerance:
+                regressions.append(stage)
+    return regressions
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="插圖生成與PDF排版的離線效能基準測試")
+    parser.add_argument("--output", default="benchmark_results.json", help="結果JSON路徑")
+    parser.add_argument("--baseline", help="與先前的結果JSON比較")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="比較時允許變慢的比例")
+    parser.add_argument("--repeat", type=int, default=3, help="每個項目的量測次數")
+    parser.add_argument("--steps", type=int, default=10, help="去噪步數")
+    parser.add_argument("--size", type=int, default=64, help="生成圖片邊長")
+    parser.add_argument("--variations", type=int, default=3, help="批次生成的變體數")
+    parser.add_argument("--skip-pdf", action="store_true", help="不量測PDF排版")
+    args = parser.parse_args()
+
+    print("⏱️ 《泡泡知道自己在哪裡》效能基準測試")
+    print("=" * 50)
+
+    torch.set_grad_enabled(False)
+    output_path = Path(args.output).resolve()
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix="bubblebook_bench_") as workdir:
+        # 生成器會在工作目錄下建立 illustrations/，在暫存目錄中執行避免汙染倉庫
+        os.chdir(workdir)
+        try:
+            print("🧪 建立迷你模型...")
+            model_dir = build_tiny_pipeline(Path(workdir) / "tiny_model")
+
+            print("🎨 量測插圖生成...")
+            results = benchmark_generation(model_dir, args)
+
+            if not args.skip_pdf:
+                print("📚 量測PDF排版...")
+                results["pdf_build"] = benchmark_pdf(args)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads()
+        },
+        "config": vars(args),
+        "results": results
+    }
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print("\n📊 結果 (平均秒數):")
+    for stage, stats in results.items():
+        print(f"  - {stage}: {stats['mean_s']:.4f}")
+    print(f"\n📁 已保存: {output_path}")
+
+    if baseline_path:
+        print(f"\n🔎 與 {baseline_path} 比較:")
+        regressions = compare(results, baseline_path, args.tolerance)
+        if regressions:
+            print(f"❌ 效能退步: {', '.join(regressions)}")
+            return False
+
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n\n⏹️ 已取消")
+        sys.exit(1)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+童書內容定義檔
+從 JSON／YAML 載入書本的頁面、文字與插圖名稱，驗證一次後快取在程序中，
+同一個程序可以連續排版多本書而不必修改程式碼
+"""
+
+import copy
+import json
+import os
+from pathlib import Path
+
+try:
+    import yaml
+except ImportError:  # 只有 .yaml／.yml 定義檔需要 PyYAML
+    yaml = None
+
+BOOKS_DIR = Path(__file__).resolve().parent / "books"
+DEFAULT_BOOK = BOOKS_DIR / "bubble.json"
+
+# 各種頁面的欄位與型別（全部必填）
+PAGE_FIELDS = {
+    "cover": {"type": str, "image": str, "title": str, "subtitle": str, "author": str, "year": str},
+    "content": {"type": str, "image": str, "texts": list}
+}
+TEXT_TYPES = ("normal", "sound", "speech")
+ROOT_FIELDS = ("title", "output", "image_dir", "variables", "editions", "pages")
+
+# 絕對路徑 -> (修改時間, 大小, BookDefinition)
+_book_cache = {}
+
+
+class BookManifestError(ValueError):
+    """定義檔格式錯誤"""
+
+
+def fill_variables(value, variables):
+    """把頁面字串中的 {變數} 換成版本的值（type 與 image 欄位除外）"""
+    if isinstance(value, str):
+        return value.format_map(variables)
+    if isinstance(value, list):
+        return [fill_variables(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: item if key in ("type", "image") else fill_variables(item, variables)
+            for key, item in value.items()
+        }
+    return value
+
+
+class BookDefinition:
+    """驗證過的書本定義"""
+
+    __slots__ = ("path", "title", "output", "image_dir", "pages", "image_index",
+                 "variables", "editions", "edition")
+
+    def __init__(self, path, title, output, image_dir, pages, variables=None, editions=(), edition=None):
+        """pages 中的字串可含 {變數}，variables 為 None 時不做替換"""
+        self.path = path
+        self.title = title
+        self.output = output
+        self.image_dir = image_dir
+        self.pages = tuple(pages)
+        self.variables = variables
+        self.editions = tuple(editions)
+        self.edition = edition
+        # 插圖名稱 -> 使用它的頁碼，缺圖檢查只需查每張圖一次
+        self.image_index = {}
+        for index, page in enumerate(self.pages):
+            self.image_index.setdefault(page["image"], []).append(index)
+
+    def image_path(self, name):
+        """插圖名稱對應的檔案路徑（不檢查是否存在）"""
+        return os.path.join(self.image_dir, name)
+
+    def missing_images(self):
+        """找不到的插圖名稱"""
+        return [name for name in self.image_index if not os.path.exists(self.image_path(name))]
+
+    def page_list(self):
+        """可供生成器修改的頁面副本，已代入版本變數"""
+        if self.variables is None:
+            return copy.deepcopy(list(self.pages))
+        return fill_variables(list(self.pages), self.variables)
+
+    def with_edition(self, edition):
+        """某個個人化版本的書本定義，輸出檔名加上版本名稱"""
+        stem, suffix = os.path.splitext(self.output)
+        return BookDefinition(
+            path=self.path,
+            title=self.title,
+            output=f"{stem}-{edition['name']}{suffix}",
+            image_dir=self.image_dir,
+            pages=self.pages,
+            variables={**(self.variables or {}), **edition["variables"]},
+            edition=edition["name"]
+        )
+
+    def edition_books(self):
+        """所有要輸出的版本，沒有定義版本時只有本身"""
+        if not self.editions:
+            return [self]
+        return [self.with_edition(edition) for edition in self.editions]
+
+
+def validate_book(data, source):
+    """檢查定義檔內容，有錯誤時拋出 BookManifestError 並指出位置"""
+    def fail(where, message):
+        raise BookManifestError(f"{source}: {where}: {message}")
+
+    if not isinstance(data, dict):
+        fail("根節點", "必須是物件")
+    for key in ("title", "pages"):
+        if key not in data:
+            fail("根節點", f"缺少 {key}")
+    for key in data:
+        if key not in ROOT_FIELDS:
+            fail("根節點", f"未知的欄位 {key}")
+    for key in ("title", "output", "image_dir"):
+        if key in data and not isinstance(data[key], str):
+            fail(key, "必須是字串")
+
+    pages = data["pages"]
+    if not isinstance(pages, list) or not pages:
+        fail("pages", "必須是非空的陣列")
+
+    for index, page in enumerate(pages):
+        where = f"pages[{index}]"
+        if not isinstance(page, dict):
+            fail(where, "必須是物件")
+        # type 可能是陣列或物件等無法作為字典鍵的值
+        fields = PAGE_FIELDS.get(page["type"]) if isinstance(page.get("type"), str) else None
+        if fields is None:
+            fail(where, f"type 必須是 {' / '.join(PAGE_FIELDS)}")
+        if (index == 0) != (page["type"] == "cover"):
+            fail(where, "第一頁必須是封面，且只能有一個封面")
+        for key, expected in fields.items():
+            if not isinstance(page.get(key), expected):
+                fail(f"{where}.{key}", f"缺少或型別不是 {expected.__name__}")
+        for key in page:
+            if key not in fields:
+                fail(where, f"未知的欄位 {key}")
+
+        for text_index, text in enumerate(page.get("texts", [])):
+            text_where = f"{where}.texts[{text_index}]"
+            if not isinstance(text, dict) or set(text) != {"type", "content"}:
+                fail(text_where, "必須是只含 type 與 content 的物件")
+            if text["type"] not in TEXT_TYPES:
+                fail(text_where, f"type 必須是 {' / '.join(TEXT_TYPES)}")
+            if not isinstance(text["content"], str):
+                fail(text_where, "content 必須是字串")
+
+    validate_editions(data, fail)
+
+
+def validate_editions(data, fail):
+    """檢查變數與個人化版本，並確認每個版本都能代入所有頁面"""
+    if "variables" not in data and "editions" not in data:
+        return
+
+    def check_variables(where, variables):
+        if not isinstance(variables, dict) or not all(
+            isinstance(key, str) and isinstance(value, str) for key, value in variables.items()
+        ):
+            fail(where, "必須是字串對字串的物件")
+
+    defaults = data.get("variables", {})
+    check_variables("variables", defaults)
+
+    editions = data.get("editions", [])
+    if not isinstance(editions, list):
+        fail("editions", "必須是陣列")
+
+    names = set()
+    for index, edition in enumerate(editions):
+        where = f"editions[{index}]"
+        if not isinstance(edition, dict) or set(edition) != {"name", "variables"}:
+            fail(where, "必須是只含 name 與 variables 的物件")
+        name = edition["name"]
+        if not isinstance(name, str) or not name or os.sep in name or name in names:
+            fail(f"{where}.name", "必須是不重複、可作為檔名的字串")
+        names.add(name)
+        check_variables(f"{where}.variables", edition["variables"])
+
+    for where, variables in [("variables", defaults)] + [
+        (f"editions[{index}]", {**defaults, **edition["variables"]}) for index, edition in enumerate(editions)
+    ]:
+        try:
+            fill_variables(data["pages"], variables)
+        except KeyError as e:
+            fail(where, f"缺少變數 {e.args[0]}")
+        except (ValueError, IndexError) as e:
+            fail(where, f"頁面文字的變數格式錯誤：{e}")
+
+
+def parse_book(path):
+    """讀取並驗證定義檔"""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix in (".yaml", ".yml"):
+            if yaml is None:
+                raise BookManifestError(f"{path}: 讀取 YAML 需要 PyYAML，請先執行 pip install pyyaml")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+
+    validate_book(data, path)
+    return BookDefinition(
+        path=str(path),
+        title=data["title"],
+        output=data.get("output", f"{data['title']}.pdf"),
+        # 插圖目錄相對於定義檔所在的目錄
+        image_dir=str(path.parent / data.get("image_dir", ".")),
+        pages=data["pages"],
+        variables=data.get("variables", {}) if "variables" in data or "editions" in data else None,
+        editions=data.get("editions", ())
+    )
+
+
+def load_book(path=DEFAULT_BOOK):
+    """載入書本定義，檔案未變更時直接使用快取"""
+    path = Path(path).resolve()
+    stat = path.stat()
+    cached = _book_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    book = parse_book(path)
+    _book_cache[path] = (stat.st_mtime_ns, stat.st_size, book)
+    return book
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+童書的中文字型
+註冊可嵌入的 TrueType 中文字型（ReportLab 只嵌入每份文件用到的字形），
+解析後的字型物件以 pickle 快取到磁碟，跨程序、跨次生成都不必重新解析大型字型檔；
+找不到字型時改用 PDF 閱讀器內建的 CID 字型 MSung-Light
+"""
+
+import functools
+import hashlib
+import operator
+import os
+import pickle
+from pathlib import Path
+from weakref import WeakKeyDictionary
+
+import reportlab
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+
+from resized_image_cache import default_cache_dir
+
+# 依序尋找的字型檔 (路徑, TTC 中的字型索引)；ReportLab 只支援 TrueType 外框，不能用 CFF 的 OTF
+FONT_SEARCH_PATH = [
+    ("fonts/NotoSansTC-Regular.ttf", 0),
+    ("/usr/share/fonts/truetype/arphic/uming.ttc", 0),
+    ("/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", 0),
+    ("/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc", 0),
+    ("/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf", 0),
+    ("/Library/Fonts/Arial Unicode.ttf", 0),
+    ("/System/Library/Fonts/Supplemental/Arial Unicode.ttf", 0),
+    ("C:/Windows/Fonts/msjh.ttc", 0),
+    ("C:/Windows/Fonts/mingliu.ttc", 0)
+]
+BOLD_SEARCH_PATH = [
+    ("fonts/NotoSansTC-Bold.ttf", 0),
+    ("C:/Windows/Fonts/msjhbd.ttc", 0)
+]
+FALLBACK_CID_FONT = "MSung-Light"
+# 用來確認字型涵蓋中文的字
+PROBE_TEXT = "泡在哪裡"
+
+# 每個程序只註冊一次
+_registered = None
+
+
+def font_cache_path(path, subfont_index, cache_dir):
+    """字型檔對應的快取檔，字型檔或 ReportLab 版本變更時自動失效"""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{subfont_index}|{reportlab.Version}"
+    return Path(cache_dir) / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.pickle"
+
+
+def load_ttfont(name, path, subfont_index=0, cache_dir=None):
+    """載入 TrueType 字型，優先使用快取中已解析的字型物件"""
+    cache_dir = Path(cache_dir) if cache_dir else default_cache_dir().parent / "fonts"
+    cache_path = font_cache_path(path, subfont_index, cache_dir)
+
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'rb') as f:
+                font = pickle.load(f)
+            font.fontName = name
+            font.state = WeakKeyDictionary()
+            return font
+        except Exception:
+            pass  # 快取損毀時重新解析
+
+    font = TTFont(name, path, subfontIndex=subfont_index)
+
+    # 每份文件的子集狀態不保存；單位換算原本是無法 pickle 的 lambda，換成等價的 partial
+    state, scale = font.state, font.face._pdfScale
+    font.state = None
+    font.face._pdfScale = functools.partial(operator.mul, 1000 / font.face.unitsPerEm)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, 'wb') as f:
+            pickle.dump(font, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    finally:
+        font.state, font.face._pdfScale = state, scale
+
+    return font
+
+
+def font_candidates(env_var, search_path):
+    """依序產生存在的候選字型檔 (路徑, 字型索引)，環境變數優先"""
+    candidates = list(search_path)
+    if os.environ.get(env_var):
+        candidates.insert(0, (os.environ[env_var], int(os.environ.get(f"{env_var}_INDEX", 0))))
+
+    base_dir = Path(__file__).resolve().parent
+    for path, subfont_index in candidates:
+        path = base_dir / path if not os.path.isabs(path) else Path(path)
+        if path.exists():
+            yield str(path), subfont_index
+
+
+def load_cjk_font(font_name, env_var, search_path, cache_dir=None):
+    """載入第一個能解析且涵蓋中文的候選字型，回傳 (字型, 路徑, 字型索引)；都不行時回傳 (None, None, 0)"""
+    for path, subfont_index in font_candidates(env_var, search_path):
+        try:
+            font = load_ttfont(font_name, path, subfont_index, cache_dir)
+        except (OSError, TTFError) as e:
+            print(f"⚠️ 無法載入字型 {path}: {e}")
+            continue
+        if not covers_cjk(font):
+            print(f"⚠️ 字型 {path} 不含中文字形，略過")
+            continue
+        return font, path, subfont_index
+    return None, None, 0
+
+
+def covers_cjk(font):
+    """字型是否包含測試用的中文字"""
+    return all(ord(char) in font.face.charToGlyph for char in PROBE_TEXT)
+
+
+def register_cjk_fonts(cache_dir=None):
+    """註冊內文與粗體的中文字型，回傳 {"regular", "bold", "embedded", "files"}"""
+    global _registered
+    if _registered:
+        return _registered
+
+    fonts = {}
+    files = []
+    for role, font_name, env_var, search_path in (
+        ("regular", "BubbleBookCJK", "BUBBLEBOOK_FONT", FONT_SEARCH_PATH),
+        ("bold", "BubbleBookCJK-Bold", "BUBBLEBOOK_FONT_BOLD", BOLD_SEARCH_PATH)
+    ):
+        font, path, subfont_index = load_cjk_font(font_name, env_var, search_path, cache_dir)
+        if font is None:
+            continue
+        pdfmetrics.registerFont(font)
+        fonts[role] = font_name
+        files.append(f"{path}#{subfont_index}")
+
+    if "regular" in fonts:
+        # 沒有粗體字型時以內文字型代替
+        fonts.setdefault("bold", fonts["regular"])
+        _registered = {**fonts, "embedded": True, "files": files}
+    else:
+        print(f"⚠️ 找不到可嵌入的中文字型，改用閱讀器內建的 {FALLBACK_CID_FONT}（可設定 BUBBLEBOOK_FONT 指定字型檔）")
+        pdfmetrics.registerFont(UnicodeCIDFont(FALLBACK_CID_FONT))
+        _registered = {"regular": FALLBACK_CID_FONT, "bold": FALLBACK_CID_FONT, "embedded": False, "files": []}
+
+    return _registered
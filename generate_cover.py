@@ -7,19 +7,17 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from image_generation_pipeline import BubbleBookGenerator
+from generation_client import get_generator
 
 def main():
     """生成封面"""
     print("🎨 生成《泡泡知道自己在哪裡》封面插圖")
     print("=" * 50)
     
-    # 創建生成器
-    generator = BubbleBookGenerator()
-    
-    # 載入模型
-    print("📥 載入模型...")
-    if not generator.load_model():
+    # 連線常駐服務，或在本程序載入模型
+    print("📥 準備生成器...")
+    generator = get_generator()
+    if generator is None:
         print("❌ 模型載入失敗")
         return False
     
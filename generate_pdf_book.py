@@ -11,20 +11,123 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.pdfgen.canvas import Canvas
 from PIL import Image as PILImage
+import argparse
+import copy
+import hashlib
+import json
+import multiprocessing
 import os
 from pathlib import Path
 
+from book_manifest import DEFAULT_BOOK, load_book
+from cjk_fonts import register_cjk_fonts
+from resized_image_cache import ResizedImageCache
+from text_layout import TextLayoutCache, style_signature
+
+try:
+    from reportlab.lib.utils import _digester
+except ImportError:  # 內部函式不存在時插圖改由 drawImage 自行編碼
+    _digester = None
+
+try:
+    from pypdf import PdfWriter
+    from streaming_pdf_writer import StreamingPdfWriter
+except ImportError:  # 只有分頁生成需要 pypdf
+    PdfWriter = None
+
+# 修改排版程式碼時遞增，讓舊的頁面片段失效
+PAGE_LAYOUT_VERSION = 3
+
+# 輸出設定：插圖縮放到版面實際尺寸下的目標解析度，以及嵌入PDF的編碼方式
+OUTPUT_PROFILES = {
+    "screen": {"dpi": 150, "format": "jpeg", "quality": 85, "progressive": False},
+    "print": {"dpi": 300, "format": "flate"},
+    "web-preview": {"dpi": 72, "format": "jpeg", "quality": 60, "progressive": True}
+}
+
+# 預先編碼的插圖直接登記為XObject時用到的 ReportLab 內部介面，不存在時退回 drawImage
+PREENCODED_CANVAS_API = ("_doc", "_setXObjects")
+PREENCODED_DOC_API = ("getXObjectName", "idToObject", "Reference", "addForm")
+PREENCODED_IMAGE_API = ("width", "height", "colorSpace", "streamContent", "_filters", "bitsPerComponent")
+
+def supports_preencoded_images(canvas):
+    """目前的 ReportLab 是否提供登記預先編碼插圖所需的內部介面"""
+    if _digester is None or not all(hasattr(canvas, attr) for attr in PREENCODED_CANVAS_API):
+        return False
+    image = PDFImageXObject("probe")
+    return (all(hasattr(canvas._doc, attr) for attr in PREENCODED_DOC_API)
+            and all(hasattr(image, attr) for attr in PREENCODED_IMAGE_API))
+
+def register_encoded_image(canvas, image_path, load_stream):
+    """把 load_stream() 讀出的預先編碼串流登記成 canvas.drawImage(image_path) 會沿用的XObject
+
+    只在尚未登記時讀取串流；介面不相容或沒有串流時回傳 False
+    """
+    if not supports_preencoded_images(canvas):
+        return False
+    # 與 canvas.drawImage 以檔名計算的名稱一致，drawImage 會沿用已登記的物件
+    name = _digester(f"{image_path}None".encode("utf-8"))
+    reg_name = canvas._doc.getXObjectName(name)
+    if reg_name not in canvas._doc.idToObject:
+        stream = load_stream()
+        if not stream:
+            return False
+        img_obj = PDFImageXObject(name)
+        img_obj.width, img_obj.height, img_obj.colorSpace, img_obj.streamContent, img_obj._filters = stream
+        img_obj.bitsPerComponent = 8
+        canvas._setXObjects(img_obj)
+        canvas._doc.Reference(img_obj, reg_name)
+        canvas._doc.addForm(name, img_obj)
+    return True
+
+# 子程序中使用的生成器（fork 時從主程序繼承）
+_worker_book = None
+
+def _render_fragment(index, fragment_path):
+    """子程序中排版一頁"""
+    _worker_book.render_page_fragment(_worker_book.pages[index], fragment_path)
+    return index
+
 class ChildrenBookGenerator:
     """兒童書籍PDF生成器"""
     
-    def __init__(self, output_path="泡泡知道自己在哪裡.pdf"):
-        """初始化生成器"""
-        self.output_path = output_path
+    def __init__(self, output_path=None, image_cache_dir=None, image_dpi=72,
+                 page_cache_dir=None, image_dedup_distance=2, profile=None,
+                 book=DEFAULT_BOOK, image_dir=None):
+        """初始化生成器
+
+        output_path: 輸出PDF路徑，預設使用定義檔中的 output
+        image_cache_dir: 縮放後插圖的快取目錄，預設為 ~/.cache/bubblebook/images
+        image_dpi: 插圖縮放的目標解析度，72 時像素數等於版面點數（指定 profile 時以 profile 為準）
+        page_cache_dir: 增量生成時單頁PDF片段的快取目錄，預設與插圖快取相鄰
+        image_dedup_distance: dHash 漢明距離不超過此值的同尺寸插圖視為同一張，None 表示只合併完全相同的檔案
+        profile: 輸出設定名稱（見 OUTPUT_PROFILES），None 表示以 image_dpi 無損輸出
+        book: 書本定義檔路徑（見 books/）
+        image_dir: 插圖目錄，預設使用定義檔中的 image_dir
+        """
+        self.book = load_book(book)
+        self.output_path = output_path or self.book.output
+        self.image_dir = image_dir if image_dir is not None else self.book.image_dir
         self.page_size = (20*cm, 20*cm)  # 20cm x 20cm 正方形
         self.margin = 1.5*cm
+        self.cover_image_size = 12*cm
+        self.content_image_size = 14*cm
+        self.text_gap = 0.3*cm  # 圖片與文字之間的距離
+        self.text_layout = TextLayoutCache()
+        self.profile = profile
+        self.image_profile = dict(OUTPUT_PROFILES[profile]) if profile else {"dpi": image_dpi, "format": "flate"}
+        self.image_dpi = self.image_profile["dpi"]
+        self.image_cache = ResizedImageCache(image_cache_dir)
+        self.page_cache_dir = Path(page_cache_dir) if page_cache_dir else self.image_cache.cache_dir.parent / "pages"
+        self.image_dedup_distance = image_dedup_distance
+        # 插圖路徑 -> 實際嵌入的代表插圖路徑
+        self.image_aliases = {}
+        # 是否能直接嵌入預先編碼的插圖，第一次繪圖時檢查
+        self.preencoded_images = None
         
         # 設置顏色
         self.bubble_blue = colors.HexColor('#1976D2')
@@ -34,111 +137,24 @@ class ChildrenBookGenerator:
         # 創建樣式
         self.setup_styles()
         
-        # 頁面內容
-        self.pages = [
-            {
-                "type": "cover",
-                "image": "Cover.png",
-                "title": "泡泡知道自己在哪裡",
-                "subtitle": "寶寶的範疇思維書",
-                "author": "作者：郭庭愷",
-                "year": "2025年"
-            },
-            {
-                "type": "content",
-                "image": "Page1.png",
-                "texts": [
-                    {"type": "sound", "content": "噗噗噗..."},
-                    {"type": "normal", "content": "泡泡從泡泡機裡飛出來"},
-                    {"type": "normal", "content": "圓圓的、透明的"},
-                    {"type": "speech", "content": "泡泡知道自己是泡泡"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page2.png",
-                "texts": [
-                    {"type": "normal", "content": "泡泡在鏡子前"},
-                    {"type": "normal", "content": "看到另一個泡泡"},
-                    {"type": "speech", "content": "那是誰？"},
-                    {"type": "speech", "content": "是我！"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page3.png",
-                "texts": [
-                    {"type": "normal", "content": "泡泡裡有彩虹"},
-                    {"type": "normal", "content": "泡泡外有風"},
-                    {"type": "normal", "content": "泡泡知道："},
-                    {"type": "speech", "content": "我在裡面，世界在外面"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page4.png",
-                "texts": [
-                    {"type": "sound", "content": "呼呼呼..."},
-                    {"type": "normal", "content": "泡泡越來越大"},
-                    {"type": "normal", "content": "邊界越來越薄"},
-                    {"type": "normal", "content": "快要...快要..."}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page5.png",
-                "texts": [
-                    {"type": "sound", "content": "啪！"},
-                    {"type": "normal", "content": "泡泡不見了"},
-                    {"type": "normal", "content": "彩虹飛散了"},
-                    {"type": "normal", "content": "風吹進來了"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page6.png",
-                "texts": [
-                    {"type": "sound", "content": "噗噗噗..."},
-                    {"type": "normal", "content": "又一個泡泡飛出來"},
-                    {"type": "normal", "content": "圓圓的、透明的"},
-                    {"type": "speech", "content": "我又是泡泡了！"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page7.png",
-                "texts": [
-                    {"type": "normal", "content": "好多泡泡！"},
-                    {"type": "normal", "content": "每個泡泡都有自己的彩虹"},
-                    {"type": "normal", "content": "每個泡泡都有自己的邊界"},
-                    {"type": "normal", "content": "每個泡泡都知道自己在哪裡"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page8.png",
-                "texts": [
-                    {"type": "normal", "content": "兩個泡泡輕輕碰在一起"},
-                    {"type": "normal", "content": "邊界變模糊了"},
-                    {"type": "speech", "content": "我們是一起的嗎？"},
-                    {"type": "speech", "content": "我們還是分開的嗎？"}
-                ]
-            },
-            {
-                "type": "content",
-                "image": "Page9.png",
-                "texts": [
-                    {"type": "normal", "content": "變成一個大泡泡！"},
-                    {"type": "normal", "content": "彩虹混合了"},
-                    {"type": "normal", "content": "邊界重新畫了"},
-                    {"type": "speech", "content": "我們現在是一體的"}
-                ]
-            }
-        ]
+        # 頁面內容（插圖名稱在排版時才解析成路徑）
+        self.pages = self.book.page_list()
     
+    def for_book(self, book, output_path=None):
+        """換成另一本書的生成器，沿用同一組樣式、字型與插圖快取"""
+        generator = copy.copy(self)
+        generator.book = book
+        generator.output_path = output_path or book.output
+        generator.image_dir = book.image_dir
+        generator.pages = book.page_list()
+        generator.image_aliases = {}
+        return generator
+
     def setup_styles(self):
         """設置文字樣式"""
         self.styles = getSampleStyleSheet()
+        # 中文字型在程序中只註冊一次，批次生成的各本書共用
+        self.fonts = register_cjk_fonts()
         
         # 標題樣式
         self.title_style = ParagraphStyle(
@@ -147,7 +163,8 @@ class ChildrenBookGenerator:
             fontSize=48,
             textColor=self.bubble_blue,
             alignment=TA_CENTER,
-            fontName='Helvetica-Bold',
+            fontName=self.fonts['bold'],
+            wordWrap='CJK',
             spaceAfter=20
         )
         
@@ -158,7 +175,8 @@ class ChildrenBookGenerator:
             fontSize=24,
             textColor=self.bubble_blue,
             alignment=TA_CENTER,
-            fontName='Helvetica',
+            fontName=self.fonts['regular'],
+            wordWrap='CJK',
             spaceAfter=30
         )
         
@@ -169,7 +187,8 @@ class ChildrenBookGenerator:
             fontSize=24,
             textColor=self.bubble_blue,
             alignment=TA_CENTER,
-            fontName='Helvetica',
+            fontName=self.fonts['regular'],
+            wordWrap='CJK',
             spaceAfter=15
         )
         
@@ -180,7 +199,8 @@ class ChildrenBookGenerator:
             fontSize=32,
             textColor=self.orange,
             alignment=TA_CENTER,
-            fontName='Helvetica-Bold',
+            fontName=self.fonts['bold'],
+            wordWrap='CJK',
             spaceAfter=20
         )
         
@@ -191,7 +211,8 @@ class ChildrenBookGenerator:
             fontSize=22,
             textColor=self.bubble_blue,
             alignment=TA_CENTER,
-            fontName='Helvetica-Bold',
+            fontName=self.fonts['bold'],
+            wordWrap='CJK',
             spaceAfter=15,
             backColor=self.bubble_bg,
             borderColor=self.bubble_blue,
@@ -206,111 +227,260 @@ class ChildrenBookGenerator:
             fontSize=18,
             textColor=self.bubble_blue,
             alignment=TA_CENTER,
-            fontName='Helvetica',
+            fontName=self.fonts['regular'],
+            wordWrap='CJK',
             spaceAfter=10
         )
+        
+        # 行距依字級設定，量測出的段落高度才會反映實際佔用的空間
+        for style in (self.title_style, self.subtitle_style, self.normal_style,
+                      self.sound_style, self.speech_style, self.author_style):
+            style.leading = style.fontSize * 1.2
     
     def resize_image(self, image_path, max_width, max_height):
-        """調整圖片大小"""
+        """調整圖片大小，回傳快取中縮放後的圖片路徑"""
         if not os.path.exists(image_path):
             print(f"警告：圖片文件不存在 {image_path}")
             return None
         
         try:
-            # 使用PIL調整圖片大小
-            with PILImage.open(image_path) as img:
-                # 計算縮放比例
-                width_ratio = max_width / img.width
-                height_ratio = max_height / img.height
-                ratio = min(width_ratio, height_ratio)
-                
-                new_width = int(img.width * ratio)
-                new_height = int(img.height * ratio)
-                
-                # 調整大小
-                resized_img = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
-                
-                # 保存臨時文件
-                temp_path = f"temp_{os.path.basename(image_path)}"
-                resized_img.save(temp_path)
-                
-                return temp_path
+            return self.image_cache.get(
+                image_path, max_width, max_height, self.image_dpi,
+                image_format=self.image_profile["format"],
+                quality=self.image_profile.get("quality"),
+                progressive=self.image_profile.get("progressive", False)
+            )
         except Exception as e:
             print(f"錯誤：無法處理圖片 {image_path}: {e}")
             return None
     
+    def find_shared_images(self):
+        """找出相同或感知上相同的插圖，讓使用它們的頁面共用同一個XObject"""
+        self.image_aliases = {}
+        canonical = []  # [(路徑, SHA-256, dHash, 尺寸)]
+
+        for page in self.pages:
+            image_path = self.image_path(page)
+            if image_path in self.image_aliases or not os.path.exists(image_path):
+                continue
+
+            sha = self.image_cache.file_hash(image_path)
+            dhash, dimensions = self.image_cache.perceptual_hash(image_path)
+            for other_path, other_sha, other_dhash, other_dimensions in canonical:
+                if sha == other_sha or (
+                    self.image_dedup_distance is not None
+                    and dimensions == other_dimensions
+                    and bin(dhash ^ other_dhash).count("1") <= self.image_dedup_distance
+                ):
+                    self.image_aliases[image_path] = other_path
+                    break
+            else:
+                self.image_aliases[image_path] = image_path
+                canonical.append((image_path, sha, dhash, dimensions))
+
+        shared = sum(1 for path, alias in self.image_aliases.items() if path != alias)
+        if shared:
+            print(f"🖼️ {shared} 張插圖與其他頁面共用")
+        return self.image_aliases
+
+    def image_path(self, story):
+        """頁面插圖的檔案路徑"""
+        return os.path.join(self.image_dir, story["image"])
+
+    def page_image(self, story):
+        """頁面實際嵌入的插圖路徑"""
+        image_path = self.image_path(story)
+        return self.image_aliases.get(image_path, image_path)
+
+    def draw_image(self, canvas, image_path, x, y, width, height):
+        """繪製快取中的圖片，預先編碼好的串流直接登記為XObject，不必每次重新編碼
+
+        ReportLab 不提供所需的內部介面時退回 drawImage 自行編碼，輸出相同、只是較慢
+        """
+        if self.preencoded_images is None:
+            self.preencoded_images = supports_preencoded_images(canvas)
+            if not self.preencoded_images:
+                print("⚠️ 此版本的 ReportLab 不支援直接嵌入預先編碼的插圖，改由 drawImage 編碼")
+
+        if self.preencoded_images:
+            register_encoded_image(canvas, image_path, lambda: self.image_cache.encoded_stream(image_path))
+
+        canvas.drawImage(image_path, x, y, width, height, mask=None)
+    
+    def page_template(self, canvas, background):
+        """頁面底圖（背景色與外框）的 form XObject，每份文件只繪製一次，各頁直接引用"""
+        name = f"BubbleBookPage_{background.hexval()[2:]}_{self.page_size[0]:.0f}x{self.page_size[1]:.0f}"
+        if not canvas.hasForm(name):
+            canvas.beginForm(name)
+            canvas.setFillColor(background)
+            canvas.rect(0, 0, self.page_size[0], self.page_size[1], fill=1)
+            canvas.endForm()
+        return name
+    
     def create_cover_page(self, story, canvas, doc):
         """創建封面頁"""
         # 添加背景色
-        canvas.setFillColor(self.bubble_bg)
-        canvas.rect(0, 0, self.page_size[0], self.page_size[1], fill=1)
+        canvas.doForm(self.page_template(canvas, self.bubble_bg))
         
         # 添加封面圖片
-        if os.path.exists(story["image"]):
-            img_path = self.resize_image(story["image"], 12*cm, 12*cm)
+        if os.path.exists(self.image_path(story)):
+            size = self.cover_image_size
+            img_path = self.resize_image(self.page_image(story), size, size)
             if img_path:
-                img = Image(img_path, width=12*cm, height=12*cm)
-                img.drawOn(canvas, 4*cm, 10*cm)
-                # 清理臨時文件
-                os.remove(img_path)
-        
-        # 添加標題
-        title = Paragraph(story["title"], self.title_style)
-        title.wrap(16*cm, 2*cm)
-        title.drawOn(canvas, 2*cm, 8*cm)
+                self.draw_image(canvas, img_path, 4*cm, 10*cm, size, size)
         
-        # 添加副標題
-        subtitle = Paragraph(story["subtitle"], self.subtitle_style)
-        subtitle.wrap(16*cm, 1*cm)
-        subtitle.drawOn(canvas, 2*cm, 7*cm)
-        
-        # 添加作者信息
-        author = Paragraph(story["author"], self.author_style)
-        author.wrap(16*cm, 1*cm)
-        author.drawOn(canvas, 2*cm, 5.5*cm)
-        
-        # 添加年份
-        year = Paragraph(story["year"], self.author_style)
-        year.wrap(16*cm, 1*cm)
-        year.drawOn(canvas, 2*cm, 5*cm)
+        # 標題、副標題、作者與年份依實際高度排在封面圖片下方
+        self.text_layout.stack(canvas, [
+            (story["title"], self.title_style),
+            (story["subtitle"], self.subtitle_style),
+            (story["author"], self.author_style),
+            (story["year"], self.author_style)
+        ], x=2*cm, top=10*cm - self.text_gap, bottom=self.margin, width=16*cm)
     
     def create_content_page(self, story, canvas, doc):
         """創建內容頁"""
         # 添加背景色
-        canvas.setFillColor(colors.white)
-        canvas.rect(0, 0, self.page_size[0], self.page_size[1], fill=1)
+        canvas.doForm(self.page_template(canvas, colors.white))
         
         # 添加頁面圖片
-        if os.path.exists(story["image"]):
-            img_path = self.resize_image(story["image"], 14*cm, 14*cm)
+        if os.path.exists(self.image_path(story)):
+            size = self.content_image_size
+            img_path = self.resize_image(self.page_image(story), size, size)
             if img_path:
-                img = Image(img_path, width=14*cm, height=14*cm)
-                img.drawOn(canvas, 3*cm, 7.5*cm)
-                # 清理臨時文件
-                os.remove(img_path)
+                self.draw_image(canvas, img_path, 3*cm, 7.5*cm, size, size)
         
-        # 添加文字內容
-        y_position = 5*cm
+        # 添加文字內容，依實際高度排在頁面圖片下方
+        items = []
         for text_item in story["texts"]:
             if text_item["type"] == "sound":
-                para = Paragraph(text_item["content"], self.sound_style)
-                para.wrap(15*cm, 1*cm)
-                para.drawOn(canvas, 2.5*cm, y_position)
-                y_position -= 0.8*cm
+                items.append((text_item["content"], self.sound_style))
             elif text_item["type"] == "speech":
-                para = Paragraph(f"「{text_item['content']}」", self.speech_style)
-                para.wrap(15*cm, 1*cm)
-                para.drawOn(canvas, 2.5*cm, y_position)
-                y_position -= 1*cm
+                items.append((f"「{text_item['content']}」", self.speech_style))
             else:  # normal
-                para = Paragraph(text_item["content"], self.normal_style)
-                para.wrap(15*cm, 1*cm)
-                para.drawOn(canvas, 2.5*cm, y_position)
-                y_position -= 0.6*cm
+                items.append((text_item["content"], self.normal_style))
+        self.text_layout.stack(canvas, items, x=2.5*cm, top=7.5*cm - self.text_gap, bottom=self.margin, width=15*cm)
     
-    def generate_pdf(self):
-        """生成PDF文件"""
+    def page_fingerprint(self, page):
+        """頁面內容、樣式與插圖的指紋，任何一項改變都會讓該頁重新排版"""
+        styles = {
+            name: style_signature(getattr(self, f"{name}_style"))
+            for name in ("title", "subtitle", "normal", "sound", "speech", "author")
+        }
+
+        payload = {
+            "version": PAGE_LAYOUT_VERSION,
+            "page": page,
+            "styles": styles,
+            "background": self.bubble_bg,
+            "fonts": self.fonts,
+            "page_size": self.page_size,
+            "image_profile": self.image_profile,
+            "image": self.image_cache.file_hash(self.page_image(page)) if os.path.exists(self.image_path(page)) else None
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def render_page_fragment(self, page, fragment_path):
+        """把單一頁面排版成獨立的一頁PDF"""
+        temp_path = Path(fragment_path).with_suffix(f".{os.getpid()}.tmp")
+        canvas = Canvas(str(temp_path), pagesize=self.page_size)
+        if page["type"] == "cover":
+            self.create_cover_page(page, canvas, None)
+        else:
+            self.create_content_page(page, canvas, None)
+        canvas.showPage()
+        canvas.save()
+        os.replace(temp_path, fragment_path)
+
+    def merge_fragments(self, fragment_paths):
+        """依頁序把單頁PDF片段合併成整本書"""
+        writer = PdfWriter()
+        for fragment_path in fragment_paths:
+            writer.append(str(fragment_path))
+        # 各片段各自嵌入的相同插圖只保留一份
+        writer.compress_identical_objects()
+
+        temp_path = f"{self.output_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            writer.write(f)
+        os.replace(temp_path, self.output_path)
+
+    def stream_fragments(self, fragment_paths):
+        """逐頁把片段寫進輸出檔，記憶體中只保留目前這一頁"""
+        temp_path = f"{self.output_path}.{os.getpid()}.tmp"
+        with StreamingPdfWriter(temp_path) as writer:
+            for fragment_path in fragment_paths:
+                writer.add_page(fragment_path)
+        os.replace(temp_path, self.output_path)
+
+    def render_fragments_parallel(self, dirty, workers):
+        """以多個子程序排版頁面，每個子程序各自完成圖片解碼、縮放與段落排版"""
+        global _worker_book
+
+        workers = min(workers, len(dirty))
+        _worker_book = self
+        context = multiprocessing.get_context("fork")
+        try:
+            with context.Pool(workers) as pool:
+                tasks = [pool.apply_async(_render_fragment, (index, path)) for index, path in dirty]
+                for task in tasks:
+                    task.get()
+        finally:
+            _worker_book = None
+
+    def generate_pdf_from_fragments(self, reuse=True, workers=1, streaming=False):
+        """逐頁排版成單頁PDF片段再依序合併
+
+        reuse: 沿用指紋相同的快取片段，只重新排版改變的頁面
+        workers: 排版頁面的子程序數
+        streaming: 逐頁寫出，峰值記憶體不隨頁數增加
+        """
+        if PdfWriter is None:
+            print("❌ 分頁生成需要 pypdf，請先執行 pip install pypdf")
+            return False
+
+        mode = "增量" if reuse else "分頁"
+        print(f"🎨 開始{mode}生成PDF童書...")
+        self.page_cache_dir.mkdir(parents=True, exist_ok=True)
+        self.find_shared_images()
+
+        fragment_paths = []
+        dirty = []
+        for index, page in enumerate(self.pages):
+            fragment_path = self.page_cache_dir / f"{self.page_fingerprint(page)}.pdf"
+            if not (reuse and fragment_path.exists()):
+                dirty.append((index, fragment_path))
+            fragment_paths.append(fragment_path)
+
+        if workers > 1 and len(dirty) > 1:
+            print(f"🧵 以 {min(workers, len(dirty))} 個子程序排版 {len(dirty)} 頁")
+            self.render_fragments_parallel(dirty, workers)
+        else:
+            for index, fragment_path in dirty:
+                self.render_page_fragment(self.pages[index], fragment_path)
+
+        self.image_cache.save_index()
+        if streaming:
+            self.stream_fragments(fragment_paths)
+        else:
+            self.merge_fragments(fragment_paths)
+
+        print(f"♻️ 沿用 {len(self.pages) - len(dirty)} 頁，重新排版 {len(dirty)} 頁")
+        print(f"✅ PDF生成完成：{self.output_path}")
+        return True
+
+    def generate_pdf(self, incremental=False, workers=1, streaming=False):
+        """生成PDF文件
+
+        incremental: 只重新排版有變動的頁面
+        workers: 大於 1 時以多個子程序逐頁排版後合併
+        streaming: 一次只排版與寫出一頁，適合大量高解析度頁面
+        """
+        if incremental or workers > 1 or streaming:
+            return self.generate_pdf_from_fragments(reuse=incremental, workers=workers, streaming=streaming)
+
         print("🎨 開始生成PDF童書...")
+        self.find_shared_images()
         
         # 創建PDF文檔
         doc = SimpleDocTemplate(
@@ -349,41 +519,68 @@ class ChildrenBookGenerator:
         
         # 構建PDF
         doc.build(story, onFirstPage=first_page, onLaterPages=content_pages)
+        self.image_cache.save_index()
         
         print(f"✅ PDF生成完成：{self.output_path}")
         return True
 
-def main():
+def main(argv=None):
     """主函數"""
-    print("📚 《泡泡知道自己在哪裡》PDF童書生成器")
+    parser = argparse.ArgumentParser(description="生成PDF版本的童書")
+    parser.add_argument("--incremental", action="store_true",
+                        help="只重新排版有變動的頁面，其餘沿用快取的單頁片段")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="逐頁排版的子程序數（大於 1 時各頁平行排版後依序合併）")
+    parser.add_argument("--streaming", action="store_true",
+                        help="逐頁排版並寫出，峰值記憶體不隨頁數增加")
+    parser.add_argument("--profile", action="append", choices=sorted(OUTPUT_PROFILES),
+                        help="輸出設定，可重複指定以一次產生多個版本，例如 --profile print --profile web-preview")
+    parser.add_argument("--book", default=str(DEFAULT_BOOK),
+                        help="書本定義檔 (JSON/YAML)，預設為 books/bubble.json")
+    args = parser.parse_args(argv)
+
+    try:
+        book = load_book(args.book)
+    except (OSError, ValueError) as e:
+        print(f"❌ 無法載入書本定義：{e}")
+        return False
+
+    print(f"📚 《{book.title}》PDF童書生成器")
     print("=" * 50)
     
     # 檢查圖片文件
-    required_images = [
-        "Cover.png", "Page1.png", "Page2.png", "Page3.png", 
-        "Page4.png", "Page5.png", "Page6.png", "Page7.png", 
-        "Page8.png", "Page9.png"
-    ]
-    
-    missing_images = []
-    for img in required_images:
-        if not os.path.exists(img):
-            missing_images.append(img)
+    missing_images = book.missing_images()
     
     if missing_images:
         print(f"❌ 缺少圖片文件：{', '.join(missing_images)}")
-        print("請確保所有圖片文件都在當前目錄中")
+        print(f"請確保所有圖片文件都在 {book.image_dir} 中")
         return False
     
     print("✅ 所有圖片文件檢查完成")
     
     # 生成PDF
-    generator = ChildrenBookGenerator()
-    success = generator.generate_pdf()
+    if args.profile:
+        stem = Path(book.output).stem
+        generators = [
+            ChildrenBookGenerator(output_path=f"{stem}-{profile}.pdf", profile=profile, book=args.book)
+            for profile in args.profile
+        ]
+    else:
+        generators = [ChildrenBookGenerator(book=args.book)]
+    
+    success = True
+    for generator in generators:
+        if generator.profile:
+            print(f"\n🖨️ 輸出設定：{generator.profile}")
+        success = generator.generate_pdf(
+            incremental=args.incremental, workers=args.workers, streaming=args.streaming
+        ) and success
     
     if success:
         print("\n🎉 童書生成完成！")
-        print(f"📁 文件位置：{generator.output_path}")
+        for generator in generators:
+            size_mb = os.path.getsize(generator.output_path) / 1024 / 1024
+            print(f"📁 文件位置：{generator.output_path} ({size_mb:.2f} MB)")
         print("📖 你可以使用PDF閱讀器查看你的童書")
     else:
         print("\n❌ 生成失敗")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+常駐生成服務的客戶端
+介面與 BubbleBookGenerator 相同，服務未啟動時退回本機載入模型
+"""
+
+import json
+import os
+import urllib.error
+import urllib.request
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# 可用環境變數指定服務位址
+SERVER_URL = os.environ.get("BUBBLEBOOK_SERVER_URL", f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+
+
+class GenerationClient:
+    """常駐生成服務客戶端"""
+
+    def __init__(self, url=SERVER_URL):
+        """初始化客戶端"""
+        self.url = url.rstrip("/")
+        self._prompts = None
+
+    def request(self, method, path, payload=None, timeout=None):
+        """發送請求並解析JSON回應"""
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(
+            f"{self.url}{path}",
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"}
+        )
+
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read() or b"{}")
+
+    def is_available(self):
+        """檢查服務是否在運行"""
+        try:
+            return self.request("GET", "/health", timeout=2).get("status") == "ok"
+        except (OSError, ValueError):
+            return False
+
+    @property
+    def prompts(self):
+        """服務端載入的提示詞配置"""
+        if self._prompts is None:
+            self._prompts = self.request("GET", "/pages")["pages"]
+        return self._prompts
+
+    def generate(self, page_id, num_variations, resume=False, workers=1, preview=False, priority=None,
+                 select="sharpness", reuse_distance=None):
+        """送出生成任務並等待結果；priority 為 None 時單頁為 interactive、整本書為 bulk
+
+        服務端的任務經由佇列依序執行，workers 僅為相容舊版服務保留；
+        select 與 reuse_distance 只用於兩階段預覽（見 BubbleBookGenerator.generate_with_preview）
+        """
+        response = self.request("POST", "/generate", {
+            "page_id": page_id,
+            "num_variations": num_variations,
+            "resume": resume,
+            "workers": workers,
+            "preview": preview,
+            "priority": priority,
+            "select": select,
+            "reuse_distance": reuse_distance
+        })
+        if "error" in response:
+            print(f"❌ 服務回報錯誤: {response['error']}")
+            return None
+        return response["results"]
+
+    def submit(self, page_id, num_variations=3, preview=False, priority=None):
+        """送出生成任務但不等待，回傳任務編號"""
+        response = self.request("POST", "/generate", {
+            "page_id": page_id,
+            "num_variations": num_variations,
+            "preview": preview,
+            "priority": priority,
+            "wait": False
+        })
+        if "error" in response:
+            print(f"❌ 服務回報錯誤: {response['error']}")
+            return None
+        return response["job"]["id"]
+
+    def job_events(self, job_id, since=0):
+        """任務狀態與第 since 筆之後的進度事件"""
+        return self.request("GET", f"/jobs/{job_id}/events?since={since}")
+
+    def cancel(self, job_id):
+        """取消任務，執行中的任務在下一個去噪步驟中止"""
+        return "error" not in self.request("DELETE", f"/jobs/{job_id}")
+
+    def generate_single_page(self, page_id, num_variations=3, resume=False):
+        """生成單頁插圖"""
+        results = self.generate(page_id, num_variations, resume)
+        return results.get(page_id) if results else None
+
+    def generate_all_images(self, num_variations=3, resume=False, workers=1):
+        """生成所有插圖"""
+        return self.generate(None, num_variations, resume, workers) or False
+
+    def generate_with_preview(self, num_variations=3, select="sharpness", workers=1, reuse_distance=None):
+        """兩階段生成：低解析度預覽後只放大選中的變體"""
+        return self.generate(None, num_variations, workers=workers, preview=True,
+                             select=select, reuse_distance=reuse_distance) or False
+
+
+def get_generator(model_name="runwayml/stable-diffusion-v1-5"):
+    """取得生成器：優先連線常駐服務，否則在本程序載入模型"""
+    client = GenerationClient()
+    if client.is_available():
+        print(f"🔌 已連線到常駐生成服務: {client.url}")
+        return client
+
+    print("💡 未偵測到常駐生成服務，將在本程序載入模型")
+    print("   （執行 python generation_server.py 可讓模型常駐，之後的指令不必重新載入）")
+
+    from image_generation_pipeline import BubbleBookGenerator
+
+    generator = BubbleBookGenerator(model_name=model_name)
+    if not generator.load_model():
+        return None
+    return generator
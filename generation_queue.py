@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+插圖生成任務佇列
+以 asyncio 管理互動（單頁預覽）與批次（整本書）兩種優先等級的任務，支援取消與進度事件。
+兩種等級各有一個執行緒：批次任務在每個去噪步驟之間檢查，有互動任務等待時就暫停並讓出 UNet，
+互動任務以共用權重、獨立調度器的生成器副本執行，完成後批次任務從原本的步驟繼續
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# 優先等級，由高到低：互動任務會在步驟之間搶先於批次任務
+PRIORITIES = ("interactive", "bulk")
+
+# 任務種類：單頁、整本書、兩階段預覽
+JOB_KINDS = ("page", "all", "preview")
+
+# 結束狀態
+FINAL_STATES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """任務在去噪步驟之間被取消"""
+
+
+class DenoiseGate:
+    """UNet 的使用權：互動任務整個期間持有，批次任務只在去噪時持有，並在步驟之間讓給等待中的互動任務"""
+
+    def __init__(self):
+        """初始化"""
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.waiting = 0
+
+    @contextmanager
+    def interactive(self):
+        """互動任務：登記等待後取得使用權，結束時喚醒暫停中的批次任務"""
+        with self.condition:
+            self.waiting += 1
+        try:
+            with self.lock:
+                yield
+        finally:
+            with self.condition:
+                self.waiting -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def bulk(self):
+        """批次任務的一次去噪呼叫"""
+        with self.lock:
+            yield
+
+    def yield_to_interactive(self):
+        """批次任務在步驟邊界呼叫：有互動任務等待時讓出使用權，等它們全部完成再取回"""
+        self.lock.release()
+        try:
+            with self.condition:
+                self.condition.wait_for(lambda: self.waiting == 0)
+        finally:
+            self.lock.acquire()
+
+
+class StepControl:
+    """設定在生成器上的去噪控制：回報進度、檢查取消，批次任務另外在步驟之間讓出 UNet"""
+
+    def __init__(self, queue, priority):
+        """初始化"""
+        self.queue = queue
+        self.priority = priority
+        self.job = None
+
+    def denoising(self):
+        """包住一次 pipeline 呼叫"""
+        return self.queue.gate.bulk() if self.priority == "bulk" else nullcontext()
+
+    def on_step(self, step, total, paused=None):
+        """每個去噪步驟結束時由生成器呼叫（在生成執行緒中）
+
+        paused: 包住讓出 UNet 期間的 context manager 工廠，讓效能指標扣除暫停時間
+        """
+        job = self.job
+        if job.cancel_requested.is_set():
+            raise JobCancelled(f"任務 {job.id} 已取消")
+
+        if self.priority == "bulk" and self.queue.gate.waiting:
+            self.queue.emit(job, "preempted", step=step)
+            with paused() if paused else nullcontext():
+                self.queue.gate.yield_to_interactive()
+            self.queue.emit(job, "resumed", step=step)
+            if job.cancel_requested.is_set():
+                raise JobCancelled(f"任務 {job.id} 已取消")
+
+        job.progress = {"step": step, "steps": total}
+        self.queue.emit(job, "progress", step=step, steps=total)
+
+
+class GenerationJob:
+    """佇列中的一個生成任務"""
+
+    def __init__(self, job_id, kind, params, priority, loop):
+        """初始化任務"""
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.status = "queued"
+        self.progress = {}
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = threading.Event()
+        self.done = loop.create_future()
+        # 訂閱進度事件的 asyncio.Queue
+        self.subscribers = set()
+
+    def summary(self):
+        """可序列化的任務狀態"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class GenerationQueue:
+    """BubbleBookGenerator 前的優先佇列"""
+
+    def __init__(self, generator):
+        """初始化佇列；互動任務使用共用權重的生成器副本"""
+        self.gate = DenoiseGate()
+        self.generators = {"bulk": generator, "interactive": generator.sibling()}
+        self.controls = {}
+        for priority, lane_generator in self.generators.items():
+            self.controls[priority] = StepControl(self, priority)
+            lane_generator.step_control = self.controls[priority]
+        self.executors = {
+            priority: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"generate-{priority}")
+            for priority in PRIORITIES
+        }
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.loop = None
+        self.lanes = None
+        self.workers = []
+
+    async def start(self):
+        """在目前的事件迴圈中啟動各優先等級的工作協程"""
+        self.loop = asyncio.get_running_loop()
+        self.lanes = {priority: asyncio.Queue() for priority in PRIORITIES}
+        self.workers = [asyncio.create_task(self.worker(priority)) for priority in PRIORITIES]
+
+    async def stop(self):
+        """取消所有任務並停止工作協程"""
+        for job in self.jobs.values():
+            if job.status not in FINAL_STATES:
+                self.cancel(job.id)
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+
+    def submit(self, kind, params=None, priority="bulk"):
+        """加入任務並回傳 GenerationJob（需在事件迴圈的執行緒中呼叫）"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"未知的任務種類: {kind}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的優先等級: {priority}")
+
+        job = GenerationJob(str(next(self.ids)), kind, dict(params or {}), priority, self.loop)
+        self.jobs[job.id] = job
+        self.lanes[priority].put_nowait(job)
+        self.publish(job, {"event": "queued", "time": time.time()})
+        return job
+
+    def cancel(self, job_id):
+        """取消任務：等待中的直接標記取消，執行中的在下一個去噪步驟中止；回傳是否找到可取消的任務"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINAL_STATES:
+            return False
+        job.cancel_requested.set()
+        if job.status == "queued":
+            self.finish(job, "cancelled")
+        return True
+
+    async def wait(self, job_id):
+        """等待任務結束並回傳任務"""
+        job = self.jobs[job_id]
+        await asyncio.shield(job.done)
+        return job
+
+    async def events(self, job_id):
+        """依序產生任務的進度事件（含訂閱前已發生的），任務結束後停止"""
+        job = self.jobs[job_id]
+        subscriber = asyncio.Queue()
+        job.subscribers.add(subscriber)
+        try:
+            for event in list(job.events):
+                yield event
+            if job.status in FINAL_STATES:
+                return
+            while True:
+                event = await subscriber.get()
+                yield event
+                if event["event"] in FINAL_STATES:
+                    return
+        finally:
+            job.subscribers.discard(subscriber)
+
+    def emit(self, job, event, **fields):
+        """從生成執行緒送出事件"""
+        self.loop.call_soon_threadsafe(self.publish, job, {"event": event, "time": time.time(), **fields})
+
+    def publish(self, job, event):
+        """記錄事件並通知訂閱者（在事件迴圈中執行）"""
+        job.events.append(event)
+        for subscriber in job.subscribers:
+            subscriber.put_nowait(event)
+
+    def finish(self, job, status, result=None, error=None):
+        """設定任務的結束狀態（在事件迴圈中執行）"""
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished = time.time()
+        self.publish(job, {"event": status, "time": job.finished, **({"error": error} if error else {})})
+        if not job.done.done():
+            job.done.set_result(job)
+
+    async def worker(self, priority):
+        """依序執行某個優先等級的任務"""
+        lane = self.lanes[priority]
+        while True:
+            job = await lane.get()
+            if job.status != "queued":
+                continue  # 等待中已被取消
+
+            job.status = "running"
+            job.started = time.time()
+            self.publish(job, {"event": "started", "time": job.started})
+            try:
+                result = await self.loop.run_in_executor(self.executors[priority], self.run_job, job)
+            except JobCancelled:
+                self.finish(job, "cancelled")
+                continue
+            except Exception as e:
+                logger.exception(f"任務 {job.id} 失敗")
+                self.finish(job, "failed", error=f"{type(e).__name__}: {e}")
+                continue
+
+            if job.cancel_requested.is_set():
+                # 最後一個去噪步驟之後才取消時，生成器已完成，仍以取消旗標為準
+                self.finish(job, "cancelled")
+            elif result is False or result is None:
+                self.finish(job, "failed", error="生成失敗")
+            else:
+                self.finish(job, "done", result=result)
+
+    def run_job(self, job):
+        """在生成執行緒中執行任務，回傳 {page_id: [路徑]}"""
+        generator = self.generators[job.priority]
+        self.controls[job.priority].job = job
+        params = job.params
+        num_variations = int(params.get("num_variations", 3))
+        resume = bool(params.get("resume", False))
+        page_id = params.get("page_id")
+
+        gate = self.gate.interactive() if job.priority == "interactive" else nullcontext()
+        with gate:
+            if job.kind == "preview":
+                page_ids = [page_id] if page_id is not None else None
+                return generator.generate_with_preview(page_ids, num_variations=num_variations,
+                                                       select=params.get("select", "sharpness"),
+                                                       reuse_distance=params.get("reuse_distance"))
+            if job.kind == "all":
+                return generator.generate_all_images(num_variations=num_variations, resume=resume)
+            return {page_id: generator.generate_single_page(page_id, num_variations=num_variations, resume=resume)}
+
+
+class BackgroundQueue:
+    """在背景執行緒中執行事件迴圈的 GenerationQueue，供同步程式（HTTP 服務、命令列）使用"""
+
+    def __init__(self, generator):
+        """啟動事件迴圈與佇列"""
+        self.loop = asyncio.new_event_loop()
+        self.queue = GenerationQueue(generator)
+        self.thread = threading.Thread(target=self.loop.run_forever, name="generation-queue", daemon=True)
+        self.thread.start()
+        self.call(self.queue.start())
+
+    def call(self, coroutine, timeout=None):
+        """在佇列的事件迴圈中執行協程並等待結果"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def run(self, func, *args):
+        """在佇列的事件迴圈中執行一般函式並等待結果"""
+        async def call():
+            return func(*args)
+        return self.call(call())
+
+    def submit(self, kind, params=None, priority="bulk"):
+        """加入任務並回傳任務編號"""
+        return self.run(lambda: self.queue.submit(kind, params, priority).id)
+
+    def status(self, job_id=None):
+        """某個任務（或全部任務）的狀態"""
+        def summarize():
+            if job_id is None:
+                return [job.summary() for job in self.queue.jobs.values()]
+            job = self.queue.jobs.get(job_id)
+            return job.summary() if job else None
+        return self.run(summarize)
+
+    def events(self, job_id, since=0):
+        """任務第 since 筆之後的事件"""
+        return self.run(lambda: list(self.queue.jobs[job_id].events[since:]) if job_id in self.queue.jobs else None)
+
+    def cancel(self, job_id):
+        """取消任務"""
+        return self.run(self.queue.cancel, job_id)
+
+    def wait(self, job_id, timeout=None):
+        """阻塞直到任務結束，回傳 (狀態, 結果, 錯誤)"""
+        job = self.call(self.queue.wait(job_id), timeout)
+        return job.status, job.result, job.error
+
+    def close(self):
+        """停止佇列與事件迴圈"""
+        self.call(self.queue.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+常駐插圖生成服務
+模型只載入一次，透過本機HTTP接收 page_id / 變體數的生成任務，
+任務經由優先佇列執行：單頁預覽優先於整本書，並可查詢進度或取消
+"""
+
+import argparse
+import json
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from generation_queue import BackgroundQueue, PRIORITIES
+from image_generation_pipeline import BubbleBookGenerator, PREVIEW_SELECTS
+from pipeline_metrics import PipelineMetrics
+from generation_client import DEFAULT_HOST, DEFAULT_PORT
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationServer(ThreadingHTTPServer):
+    """持有已載入模型的HTTP服務"""
+
+    daemon_threads = True
+
+    def __init__(self, address, generator):
+        super().__init__(address, GenerationRequestHandler)
+        self.generator = generator
+        # pipeline 與調度器不是執行緒安全的，所有生成任務都經由佇列執行；
+        # 單頁任務為互動等級，可在去噪步驟之間搶先於整本書的批次任務
+        self.queue = BackgroundQueue(generator)
+
+    def server_close(self):
+        super().server_close()
+        self.queue.close()
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """處理生成請求"""
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def job_path(self):
+        """解析 /jobs/<編號>[/cancel]，回傳 (編號, 動作, 查詢參數)"""
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) > 3:
+            return None
+        return (parts[1] if len(parts) > 1 else None), (parts[2] if len(parts) > 2 else None), parse_qs(url.query)
+
+    def do_GET(self):
+        generator = self.server.generator
+
+        if self.path == "/health":
+            self.send_json(200, {
+                "status": "ok",
+                "model": generator.model_name,
+                "device": generator.device
+            })
+        elif self.path == "/pages":
+            self.send_json(200, {"pages": generator.prompts})
+        elif self.job_path():
+            job_id, action, query = self.job_path()
+            queue = self.server.queue
+            if job_id is None:
+                self.send_json(200, {"jobs": queue.status()})
+                return
+            status = queue.status(job_id)
+            if status is None:
+                self.send_json(404, {"error": f"找不到任務: {job_id}"})
+            elif action == "events":
+                # 以 since 取得上次之後的新事件
+                since = int(query.get("since", ["0"])[0])
+                self.send_json(200, {"job": status, "events": queue.events(job_id, since)})
+            elif action is None:
+                self.send_json(200, {"job": status})
+            else:
+                self.send_json(404, {"error": f"未知路徑: {self.path}"})
+        else:
+            self.send_json(404, {"error": f"未知路徑: {self.path}"})
+
+    def do_DELETE(self):
+        parsed = self.job_path()
+        if not parsed or parsed[0] is None or parsed[1] is not None:
+            self.send_json(404, {"error": f"未知路徑: {self.path}"})
+            return
+        job_id = parsed[0]
+        if self.server.queue.status(job_id) is None:
+            self.send_json(404, {"error": f"找不到任務: {job_id}"})
+        elif self.server.queue.cancel(job_id):
+            self.send_json(200, {"job": self.server.queue.status(job_id)})
+        else:
+            self.send_json(409, {"error": f"任務 {job_id} 已結束"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self.send_json(404, {"error": f"未知路徑: {self.path}"})
+            return
+
+        try:
+            request = self.read_json()
+            page_id = request.get("page_id")
+            params = {
+                "page_id": page_id,
+                "num_variations": int(request.get("num_variations", 3)),
+                "resume": bool(request.get("resume", False))
+            }
+            preview = bool(request.get("preview", False))
+            if preview:
+                params["select"] = request.get("select") or "sharpness"
+                if request.get("reuse_distance") is not None:
+                    params["reuse_distance"] = int(request["reuse_distance"])
+            # 預設：指定單頁的任務是設計者在等結果的互動任務，整本書為批次任務
+            priority = request.get("priority") or ("bulk" if page_id is None else "interactive")
+            wait = bool(request.get("wait", True))
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": f"無效請求: {e}"})
+            return
+
+        generator = self.server.generator
+        if page_id is not None and page_id not in generator.prompts:
+            self.send_json(404, {"error": f"找不到頁面: {page_id}"})
+            return
+        if priority not in PRIORITIES:
+            self.send_json(400, {"error": f"未知的優先等級: {priority}"})
+            return
+        if params.get("select", "sharpness") not in PREVIEW_SELECTS:
+            self.send_json(400, {"error": f"未知的挑選規則: {params['select']}"})
+            return
+
+        kind = "preview" if preview else ("all" if page_id is None else "page")
+        job_id = self.server.queue.submit(kind, params, priority)
+        if not wait:
+            self.send_json(202, {"job": self.server.queue.status(job_id)})
+            return
+
+        status, results, error = self.server.queue.wait(job_id)
+        if status != "done":
+            self.send_json(409 if status == "cancelled" else 500, {"error": error or "任務已取消", "job_id": job_id})
+            return
+
+        self.send_json(200, {
+            "job_id": job_id,
+            "results": {
+                # 回傳絕對路徑，客戶端的工作目錄可能與服務不同
+                pid: [os.path.abspath(path) for path in (paths or [])]
+                for pid, paths in results.items()
+            }
+        })
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="常駐插圖生成服務")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default="runwayml/stable-diffusion-v1-5")
+    parser.add_argument("--metrics", help="匯出效能指標的路徑（.prom 為 Prometheus 格式，其餘為 JSON lines）")
+    args = parser.parse_args()
+
+    metrics = PipelineMetrics(args.metrics) if args.metrics else None
+    generator = BubbleBookGenerator(model_name=args.model, metrics=metrics)
+    if not generator.load_model():
+        print("❌ 模型載入失敗，請檢查環境設置")
+        return False
+
+    server = GenerationServer((args.host, args.port), generator)
+    print(f"🚀 生成服務已啟動: http://{args.host}:{args.port}")
+    print("💡 generate_cover.py、run_pipeline.py 等腳本會自動連線到此服務")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n\n⏹️ 服務已停止")
+    finally:
+        server.server_close()
+
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+生成插圖的後製
+把 illustrations/generated 的圖片整批疊成 NumPy 陣列，一次完成：
+對參考頁做色彩直方圖匹配、限制為粉彩色調、放大到 300 DPI 的印刷尺寸、反銳化遮罩銳化，
+輸出到 illustrations/processed，取代以往在 GIMP 中逐張手動調整
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+INPUT_DIR = Path("illustrations/generated")
+OUTPUT_DIR = Path("illustrations/processed")
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+# 印刷設定：PDF 內頁插圖寬 14cm，以 300 DPI 輸出
+PRINT_DPI = 300
+PRINT_SIZE_CM = 14.0
+
+# 粉彩色調：飽和度上限 (0-1) 與最暗亮度 (0-255)
+PASTEL_CONFIG = {"max_saturation": 0.55, "min_value": 48}
+
+# 反銳化遮罩：高斯半徑 (像素)、強度、低於門檻的差異不銳化以免放大雜訊
+SHARPEN_CONFIG = {"radius": 2.0, "amount": 0.6, "threshold": 2}
+
+# 輸出 PNG 的壓縮等級：後製圖只是排版前的中間檔，壓縮等級 3 比預設快一倍多、檔案只大約一成
+PNG_COMPRESS_LEVEL = 3
+
+# 每次同時做色彩處理的圖片數：色彩階段在原始解析度進行，1024² 的圖片連同 float32 暫存約 45 MB／張；
+# 放大到印刷尺寸後逐張銳化（1654² 的 float32 約 33 MB，連同模糊暫存約 150 MB），不隨 CHUNK_SIZE 增加。
+# 實測 8 張 1024² 一批的峰值 RSS 約 500 MB
+CHUNK_SIZE = 8
+
+
+def load_batch(paths, size=None):
+    """讀取圖片並疊成 (N, H, W, 3) 的 uint8 陣列，尺寸不同時縮放到第一張的大小"""
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+            size = size or img.size
+            if img.size != size:
+                img = img.resize(size, Image.Resampling.LANCZOS)
+            images.append(np.asarray(img))
+    return np.stack(images)
+
+
+def channel_cdfs(batch):
+    """每張圖每個色版的累積分布，形狀 (N, 3, 256)"""
+    n = batch.shape[0]
+    # 把 (圖片, 色版, 數值) 攤平成單一索引，一次 bincount 算出所有直方圖
+    offsets = (np.arange(n)[:, None, None, None] * 3 + np.arange(3)) * 256
+    counts = np.bincount((batch + offsets).ravel(), minlength=n * 3 * 256).reshape(n, 3, 256)
+    cdf = np.cumsum(counts, axis=2, dtype=np.float64)
+    return cdf / cdf[:, :, -1:]
+
+
+def match_histograms(batch, reference):
+    """把每張圖的各色版直方圖對應到參考圖，讓整本書的色調一致"""
+    source_cdf = channel_cdfs(batch)
+    reference_cdf = channel_cdfs(reference[None])[0]
+
+    # 查表：來源數值 -> 參考圖中累積分布相同位置的數值
+    lut = np.empty(source_cdf.shape, dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.searchsorted(reference_cdf[channel], source_cdf[:, channel]).clip(0, 255)
+
+    image_index = np.arange(batch.shape[0])[:, None, None, None]
+    channel_index = np.arange(3)
+    return lut[image_index, channel_index, batch]
+
+
+def clamp_pastel(batch, max_saturation=None, min_value=None):
+    """限制飽和度並提亮暗部，float32 輸入輸出（0-255）"""
+    max_saturation = PASTEL_CONFIG["max_saturation"] if max_saturation is None else max_saturation
+    min_value = PASTEL_CONFIG["min_value"] if min_value is None else min_value
+
+    value = batch.max(axis=-1, keepdims=True)
+    chroma = value - batch.min(axis=-1, keepdims=True)
+    saturation = np.divide(chroma, value, out=np.zeros_like(value), where=value > 0)
+    # 飽和度超過上限時把各色版往最大值拉近，色相不變
+    scale = np.minimum(1.0, max_saturation / np.maximum(saturation, 1e-6))
+    batch = value - (value - batch) * scale
+    # 亮度整體線性壓縮到 [min_value, 255]
+    return min_value + batch * ((255.0 - min_value) / 255.0)
+
+
+def gaussian_kernel(radius):
+    """一維高斯核，長度約 6σ"""
+    half = max(1, int(np.ceil(3 * radius)))
+    x = np.arange(-half, half + 1, dtype=np.float32)
+    kernel = np.exp(-0.5 * (x / radius) ** 2)
+    return kernel / kernel.sum()
+
+
+def blur_axis(batch, kernel, axis):
+    """沿一個軸做一維卷積（邊緣延伸），以位移相加的方式對整批一次運算"""
+    half = len(kernel) // 2
+    pad = [(0, 0)] * batch.ndim
+    pad[axis] = (half, half)
+    padded = np.pad(batch, pad, mode="edge")
+    window = [slice(None)] * batch.ndim
+    result = np.zeros_like(batch)
+    term = np.empty_like(batch)
+    for offset, weight in enumerate(kernel):
+        window[axis] = slice(offset, offset + batch.shape[axis])
+        np.multiply(padded[tuple(window)], weight, out=term)
+        result += term
+    return result
+
+
+def unsharp_mask(batch, radius=None, amount=None, threshold=None):
+    """反銳化遮罩：原圖加上 (原圖 - 高斯模糊) × 強度，float32 輸入輸出"""
+    radius = SHARPEN_CONFIG["radius"] if radius is None else radius
+    amount = SHARPEN_CONFIG["amount"] if amount is None else amount
+    threshold = SHARPEN_CONFIG["threshold"] if threshold is None else threshold
+
+    kernel = gaussian_kernel(radius)
+    blurred = blur_axis(blur_axis(batch, kernel, axis=1), kernel, axis=2)
+    detail = batch - blurred
+    detail[np.abs(detail) < threshold] = 0
+    return batch + amount * detail
+
+
+def print_pixels(dpi=PRINT_DPI, size_cm=PRINT_SIZE_CM):
+    """印刷尺寸對應的像素邊長"""
+    return round(size_cm / 2.54 * dpi)
+
+
+def resample(batch, pixels):
+    """把整批 uint8 圖片以 Lanczos 縮放成 pixels × pixels"""
+    if batch.shape[1:3] == (pixels, pixels):
+        return batch
+    return np.stack([
+        np.asarray(Image.fromarray(image).resize((pixels, pixels), Image.Resampling.LANCZOS))
+        for image in batch
+    ])
+
+
+def to_uint8(batch):
+    """float 陣列四捨五入並截斷成 uint8"""
+    return np.clip(batch + 0.5, 0, 255).astype(np.uint8)
+
+
+def process_batch(batch, reference, pixels):
+    """對一批 uint8 圖片依序做直方圖匹配、粉彩色調、印刷縮放與銳化
+
+    色彩處理整批進行；放大後的圖片逐張銳化並寫回同一個陣列，峰值記憶體只多一張圖的暫存
+    """
+    matched = match_histograms(batch, reference)
+    pastel = to_uint8(clamp_pastel(matched.astype(np.float32)))
+    del matched
+    resized = resample(pastel, pixels)
+    del pastel
+    for image in resized:
+        image[...] = to_uint8(unsharp_mask(image[None].astype(np.float32))[0])
+    return resized
+
+
+def find_images(input_dir):
+    """輸入目錄中的所有圖片，依檔名排序"""
+    return sorted(path for path in Path(input_dir).iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def default_reference(paths):
+    """預設的參考頁：封面的第一個變體，沒有封面時用第一張圖"""
+    covers = [path for path in paths if path.stem.startswith("cover")]
+    return (covers or paths)[0]
+
+
+def postprocess_directory(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, reference=None,
+                          dpi=PRINT_DPI, size_cm=PRINT_SIZE_CM, chunk_size=CHUNK_SIZE):
+    """處理目錄中的所有圖片，回傳輸出的路徑"""
+    paths = find_images(input_dir)
+    if not paths:
+        return []
+
+    reference_path = Path(reference) if reference else default_reference(paths)
+    reference_image = load_batch([reference_path])[0]
+    pixels = print_pixels(dpi, size_cm)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    for start in range(0, len(paths), chunk_size):
+        chunk = paths[start:start + chunk_size]
+        processed = process_batch(load_batch(chunk), reference_image, pixels)
+        for path, image in zip(chunk, processed):
+            output_path = output_dir / f"{path.stem}.png"
+            Image.fromarray(image).save(output_path, dpi=(dpi, dpi), compress_level=PNG_COMPRESS_LEVEL)
+            outputs.append(output_path)
+
+    return outputs
+
+
+def main(argv=None):
+    """主函數"""
+    parser = argparse.ArgumentParser(description="生成插圖的批次後製（色彩匹配、粉彩色調、銳化、印刷縮放）")
+    parser.add_argument("--input-dir", default=str(INPUT_DIR), help="生成插圖目錄")
+    parser.add_argument("--output-dir", default=str(OUTPUT_DIR), help="後製輸出目錄")
+    parser.add_argument("--reference", help="色彩匹配的參考圖，預設為封面的第一個變體")
+    parser.add_argument("--dpi", type=int, default=PRINT_DPI, help="印刷解析度")
+    parser.add_argument("--size-cm", type=float, default=PRINT_SIZE_CM, help="印刷邊長（公分）")
+    args = parser.parse_args(argv)
+
+    print("🎨 插圖後製")
+    print("=" * 50)
+
+    if not Path(args.input_dir).is_dir():
+        print(f"❌ 找不到目錄: {args.input_dir}")
+        return False
+
+    start = time.perf_counter()
+    outputs = postprocess_directory(args.input_dir, args.output_dir, args.reference, args.dpi, args.size_cm)
+    if not outputs:
+        print(f"❌ {args.input_dir} 中沒有圖片")
+        return False
+
+    print(f"✅ 完成 {len(outputs)} 張，{time.perf_counter() - start:.1f} 秒 → {args.output_dir}")
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n\n⏹️ 已取消")
+        sys.exit(1)
@@ -4,28 +4,134 @@
 使用Stable Diffusion自動生成所有插圖
 """
 
+import argparse
+import copy
 import torch
 import json
 import os
+import shutil
+import numpy as np
 from pathlib import Path
 from PIL import Image
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+from diffusers import StableDiffusionPipeline, StableDiffusionImg2ImgPipeline, DPMSolverMultistepScheduler
+from prompt_embedding_cache import PromptEmbeddingCache
+from render_cache import RenderCache
+from job_journal import JobJournal, file_digest
+from generation_queue import JobCancelled
+from thermal_throttle import ThermalThrottle
+from pipeline_metrics import PipelineMetrics
+from generation_client import get_generator
+from variation_selector import score_pages, select_best
+from artwork_index import ArtworkIndex
 import logging
+import multiprocessing
 from tqdm import tqdm
-import time
+import zlib
+from contextlib import nullcontext
 
 # 設置日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 風格關鍵詞，附加在每個提示詞後面
+STYLE_TAGS = "children's book illustration, soft watercolor, gentle colors, pastel colors, dreamy atmosphere"
+
+# 輸出圖片尺寸
+IMAGE_WIDTH = 1024
+IMAGE_HEIGHT = 1024
+
+# 每百萬像素單張圖片的估計峰值記憶體 (MB)，用來推算批次大小
+MEMORY_PER_MEGAPIXEL_MB = {"cuda": 1200, "cpu": 2400}
+
+# 預覽階段：低解析度、少步數，為每個變體快速出圖
+PREVIEW_CONFIG = {"width": 512, "height": 512, "steps": 10}
+
+# 放大階段：img2img 以放大後的預覽圖為起點重繪（實際步數 = steps × strength），
+# rerender 則以相同種子直接生成完整解析度
+UPSCALE_CONFIG = {"mode": "img2img", "strength": 0.5, "steps": 25, "guidance": 7.5}
+
+# 預覽挑選規則的名稱（見 select_previews）
+PREVIEW_SELECTS = ("sharpness", "first", "score")
+
+def image_sharpness(image_path):
+    """拉普拉斯變異數，數值越大圖片越清晰"""
+    with Image.open(image_path) as img:
+        gray = np.asarray(img.convert("L"), dtype=np.float32)
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+def available_memory_bytes():
+    """系統可用記憶體 (bytes)
+
+    優先讀 /proc/meminfo 的 MemAvailable（含可回收的頁面快取）：載入模型權重後頁面快取會佔掉大部分空閒記憶體，
+    只看 MemFree（SC_AVPHYS_PAGES）會嚴重低估；沒有 /proc/meminfo 的系統才退回 sysconf
+    """
+    try:
+        with open("/proc/meminfo", 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+# 多程序模式下由子程序 fork 繼承的生成器，模型權重以寫時複製共享
+_worker_generator = None
+
+def _init_worker(num_threads, memory_budget_mb):
+    """子程序初始化：分配 torch 執行緒數與記憶體預算"""
+    torch.set_num_threads(num_threads)
+    _worker_generator.memory_budget_mb = memory_budget_mb
+    if _worker_generator.metrics:
+        # 從主程序繼承的累計值不重複回報
+        _worker_generator.metrics.reset()
+
+def _render_page_jobs(jobs, batch_size, render_args):
+    """子程序中生成一個頁面的任務，回傳 ([(任務名, 路徑)], 節流秒數, 效能指標)"""
+    results = []
+    throttled = 0.0
+    for start in range(0, len(jobs), batch_size):
+        batch = jobs[start:start + batch_size]
+        paths = _worker_generator.generate_batch(batch, restore=False, **render_args)
+        results.extend((job["output_name"], path) for job, path in zip(batch, paths))
+        throttled += _worker_generator.throttle.wait_if_needed()
+    metrics = _worker_generator.metrics.drain() if _worker_generator.metrics else None
+    return results, throttled, metrics
+
 class BubbleBookGenerator:
     """泡泡書籍插圖生成器"""
     
-    def __init__(self, model_name="runwayml/stable-diffusion-v1-5"):
-        """初始化生成器"""
+    def __init__(self, model_name="runwayml/stable-diffusion-v1-5", batch_size=4, memory_budget_mb=None,
+                 embedding_cache_dir="illustrations/cache/embeddings",
+                 render_cache_dir="illustrations/cache/renders", seed=0,
+                 journal_path="illustrations/generated/journal.jsonl", throttle=None, metrics=None):
+        """初始化生成器
+
+        batch_size: 單次pipeline呼叫最多生成的圖片數
+        memory_budget_mb: 生成可用的記憶體預算，None 表示依系統可用記憶體估算
+        embedding_cache_dir: 提示詞嵌入快取目錄，None 表示不使用快取
+        render_cache_dir: 內容定址輸出庫目錄，None 表示每次都重新生成
+        seed: 基礎種子，每個頁面/變體的種子由此推導
+        journal_path: 任務日誌路徑，記錄每個任務的種子與參數，供 resume 續跑
+        throttle: 節流器，預設只在CPU溫度超過門檻時暫停
+        metrics: PipelineMetrics，啟用分段計時與指標匯出；None 時完全不量測
+        """
         self.model_name = model_name
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.pipeline = None
+        self.img2img_pipeline = None
+        self.batch_size = batch_size
+        self.memory_budget_mb = memory_budget_mb
+        self.embedding_cache = PromptEmbeddingCache(embedding_cache_dir) if embedding_cache_dir else None
+        self.render_cache = RenderCache(render_cache_dir) if render_cache_dir else None
+        self.seed = seed
+        self.journal = JobJournal(journal_path)
+        self.throttle = throttle or ThermalThrottle()
+        self.metrics = metrics
+        # 任務佇列設定的去噪控制（提供 denoising() 與 on_step(step, total)），None 表示不受控制
+        self.step_control = None
+        self.style_tags = STYLE_TAGS
         self.output_dir = Path("illustrations/generated")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
@@ -42,6 +148,8 @@ class BubbleBookGenerator:
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
             self.prompts = config['illustrations']
+            if config.get('style_tags'):
+                self.style_tags = ", ".join(config['style_tags'])
             logger.info(f"載入 {len(self.prompts)} 個提示詞")
         else:
             # 使用內建提示詞
@@ -138,69 +246,413 @@ class BubbleBookGenerator:
             logger.error(f"模型載入失敗: {e}")
             return False
     
+    def get_memory_budget_mb(self):
+        """取得生成可用的記憶體預算 (MB)"""
+        if self.memory_budget_mb:
+            return self.memory_budget_mb
+        
+        try:
+            if self.device == "cuda":
+                total = torch.cuda.get_device_properties(0).total_memory
+            else:
+                total = available_memory_bytes()
+        except (ValueError, OSError, AttributeError):
+            return 4096
+        
+        # 保留一半給模型權重與系統
+        return total // (1024 * 1024) // 2
+    
+    def get_batch_size(self, requested=None, width=None, height=None, memory_budget_mb=None):
+        """依記憶體預算計算實際批次大小"""
+        width, height = width or IMAGE_WIDTH, height or IMAGE_HEIGHT
+        per_image_mb = MEMORY_PER_MEGAPIXEL_MB[self.device] * width * height / 1_000_000
+        fit = max(1, int((memory_budget_mb or self.get_memory_budget_mb()) // per_image_mb))
+        return max(1, min(requested or self.batch_size or 1, fit))
+    
+    def make_job(self, page_id, variation):
+        """建立單張圖片的生成任務"""
+        prompt_data = self.prompts[page_id]
+        return {
+            "page_id": page_id,
+            "variation": variation,
+            "output_name": f"{page_id}_v{variation}",
+            "seed": self.derive_seed(page_id, variation),
+            "prompt": prompt_data["prompt"],
+            "negative": prompt_data["negative"]
+        }
+    
+    def derive_seed(self, page_id, variation):
+        """由基礎種子、頁面與變體編號推導固定種子"""
+        return (self.seed + zlib.crc32(page_id.encode("utf-8")) + variation) % 2**32
+    
+    def render_params(self, job, num_inference_steps, guidance_scale, width=None, height=None):
+        """影響生成結果的全部參數，作為輸出庫的鍵"""
+        scheduler = self.pipeline.scheduler
+        params = {
+            "prompt": job["prompt"],
+            "negative": job["negative"],
+            "style_tags": self.style_tags,
+            "model": self.model_name,
+            "scheduler": {"class": type(scheduler).__name__, "config": dict(scheduler.config)},
+            "steps": num_inference_steps,
+            "guidance": guidance_scale,
+            "width": width or IMAGE_WIDTH,
+            "height": height or IMAGE_HEIGHT,
+            "seed": job["seed"]
+        }
+        if "upscale" in job:
+            params["upscale"] = job["upscale"]
+        return params
+    
+    def encode_text(self, text):
+        """將文字編碼為CLIP嵌入，優先使用快取"""
+        if self.embedding_cache is None:
+            embeds, _ = self.pipeline.encode_prompt(text, self.device, 1, False)
+            return embeds
+        
+        key = self.embedding_cache.make_key(self.model_name, self.pipeline.tokenizer, text)
+        embeds = self.embedding_cache.get(key)
+        if embeds is None:
+            embeds, _ = self.pipeline.encode_prompt(text, self.device, 1, False)
+            self.embedding_cache.put(key, embeds)
+        
+        return embeds.to(self.device, dtype=self.pipeline.text_encoder.dtype)
+    
     def generate_image(self, prompt, negative_prompt, page_id, num_inference_steps=20, guidance_scale=7.5):
         """生成單張圖片"""
-        logger.info(f"生成 {page_id}...")
+        job = {
+            "page_id": page_id,
+            "variation": 1,
+            "output_name": page_id,
+            "seed": self.derive_seed(page_id, 1),
+            "prompt": prompt,
+            "negative": negative_prompt
+        }
+        return self.generate_batch([job], num_inference_steps, guidance_scale)[0]
+    
+    def measure(self, stage):
+        """量測階段耗時，未啟用指標時不做任何事"""
+        return self.metrics.stage(stage) if self.metrics else nullcontext()
+    
+    def decode_latents(self, pipeline, latents):
+        """VAE解碼為PIL圖片"""
+        images = pipeline.vae.decode(latents / pipeline.vae.config.scaling_factor, return_dict=False)[0]
+        return pipeline.image_processor.postprocess(images, output_type="pil")
+    
+    def step_callback(self):
+        """組合效能指標與去噪控制的 callback_on_step_end，兩者都未啟用時回傳 None"""
+        metrics_callback = self.metrics.step_callback() if self.metrics else None
+        step_control = self.step_control
+        if step_control is None:
+            return metrics_callback
         
-        try:
-            # 添加風格關鍵詞
-            style_tags = "children's book illustration, soft watercolor, gentle colors, pastel colors, dreamy atmosphere"
-            full_prompt = f"{prompt}, {style_tags}"
-            
-            # 生成圖片
-            with torch.autocast(self.device):
-                result = self.pipeline(
-                    prompt=full_prompt,
-                    negative_prompt=negative_prompt,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    width=1024,
-                    height=1024,
-                    num_images_per_prompt=1
-                )
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            if metrics_callback:
+                callback_kwargs = metrics_callback(pipe, step, timestep, callback_kwargs)
+            # 讓給互動任務的時間記為 preempted，不算進這個任務的去噪步驟與階段耗時
+            step_control.on_step(step + 1, getattr(pipe, "num_timesteps", None),
+                                 paused=self.metrics.paused if self.metrics else None)
+            return callback_kwargs
+        
+        return on_step_end
+    
+    def sibling(self):
+        """共用模型權重、但有獨立調度器的生成器副本
+
+        多步調度器在去噪過程中保存狀態，另一個任務在步驟之間插隊時必須使用自己的調度器，
+        暫停中的任務恢復後才能接續原本的狀態
+        """
+        sibling = copy.copy(self)
+        components = dict(self.pipeline.components)
+        components["scheduler"] = copy.deepcopy(self.pipeline.scheduler)
+        sibling.pipeline = type(self.pipeline)(**components)
+        sibling.img2img_pipeline = None
+        # 輸出庫的待寫回紀錄不能與原生成器共用
+        sibling.render_cache = RenderCache(self.render_cache.root) if self.render_cache else None
+        sibling.step_control = None
+        return sibling
+    
+    def get_img2img_pipeline(self):
+        """與 txt2img 共用權重的 img2img pipeline，用於放大預覽圖"""
+        if self.img2img_pipeline is None:
+            self.img2img_pipeline = StableDiffusionImg2ImgPipeline(**self.pipeline.components)
+        return self.img2img_pipeline
+    
+    def render_images(self, jobs, num_inference_steps, guidance_scale, width=None, height=None):
+        """在一次pipeline呼叫中生成多張圖片，回傳與 jobs 順序相同的圖片列表
+
+        任務帶有 init_image 時改用 img2img，以預覽圖為起點重繪
+        """
+        # 相同提示詞合併，讓同一頁的變體共用一次文字編碼
+        groups = {}
+        for index, job in enumerate(jobs):
+            groups.setdefault((job["prompt"], job["negative"]), []).append(index)
+        
+        if len({len(indices) for indices in groups.values()}) == 1:
+            prompt_pairs = list(groups)
+            images_per_prompt = len(jobs) // len(groups)
+            order = [index for indices in groups.values() for index in indices]
+        else:
+            prompt_pairs = [(job["prompt"], job["negative"]) for job in jobs]
+            images_per_prompt = 1
+            order = list(range(len(jobs)))
+        
+        # 文字編碼（tokenize + CLIP，命中快取時完全跳過）
+        with torch.no_grad(), self.measure("text_encode"):
+            prompt_embeds = torch.cat([self.encode_text(f"{prompt}, {self.style_tags}") for prompt, _ in prompt_pairs])
+            negative_embeds = torch.cat([self.encode_text(negative) for _, negative in prompt_pairs])
+        
+        # 每張圖片各自的種子，批次組合不影響結果
+        generators = [torch.Generator("cpu").manual_seed(jobs[index]["seed"]) for index in order]
+        
+        call_args = dict(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_embeds,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            num_images_per_prompt=images_per_prompt,
+            generator=generators,
+            # 去噪後自行解碼，VAE 與 UNet 的耗時才能分開量測
+            output_type="latent",
+            callback_on_step_end=self.step_callback()
+        )
+        if "init_image" in jobs[0]:
+            pipeline = self.get_img2img_pipeline()
+            call_args["image"] = [jobs[index]["init_image"] for index in order]
+            call_args["strength"] = jobs[0]["upscale"]["strength"]
+        else:
+            pipeline = self.pipeline
+            call_args["width"] = width or IMAGE_WIDTH
+            call_args["height"] = height or IMAGE_HEIGHT
+        
+        # 生成圖片
+        with torch.autocast(self.device):
+            with self.measure("denoise"), (self.step_control.denoising() if self.step_control else nullcontext()):
+                latents = pipeline(**call_args).images
+            with torch.no_grad(), self.measure("vae_decode"):
+                decoded = self.decode_latents(pipeline, latents)
+        
+        images = [None] * len(jobs)
+        for index, image in zip(order, decoded):
+            images[index] = image
+        return images
+    
+    def prepare_jobs(self, jobs, num_inference_steps, guidance_scale, width=None, height=None):
+        """為任務附上完整生成參數與其雜湊值"""
+        for job in jobs:
+            job["params"] = self.render_params(job, num_inference_steps, guidance_scale, width, height)
+            job["cache_key"] = RenderCache.make_key(job["params"])
+    
+    def restore_cached(self, jobs, num_inference_steps, guidance_scale, width=None, height=None):
+        """從輸出庫取回輸入未變更的圖片，回傳 (已取回的 [(任務, 路徑)], 仍需生成的任務)"""
+        self.prepare_jobs(jobs, num_inference_steps, guidance_scale, width, height)
+        if not self.render_cache:
+            return [], list(jobs)
+        
+        restored = []
+        pending = []
+        with self.measure("cache_restore"):
+            for job in jobs:
+                output_path = self.output_dir / f"{job['output_name']}.png"
+                
+                if self.render_cache.restore(job["cache_key"], output_path):
+                    self.render_cache.record(job["page_id"], job["variation"], job["cache_key"], job["params"],
+                                             preview=job.get("preview", False))
+                    self.journal.record_done(job, output_path, source="cache")
+                    restored.append((job, output_path))
+                    logger.info(f"♻️ {job['output_name']} 輸入未變更，沿用已生成圖片")
+                else:
+                    pending.append(job)
             
-            # 保存圖片
-            image = result.images[0]
-            output_path = self.output_dir / f"{page_id}_v1.png"
-            image.save(output_path, "PNG", quality=95)
+            self.render_cache.save_manifest()
+        
+        return restored, pending
+    
+    def generate_batch(self, jobs, num_inference_steps=25, guidance_scale=7.5, width=None, height=None, restore=True):
+        """生成一批圖片並保存，回傳與 jobs 順序相同的路徑列表
+
+        restore: 先從輸出庫取回輸入未變更的圖片；呼叫端已用 restore_cached 過濾過時傳 False
+        去噪步驟中被任務佇列取消時，未完成的任務記為取消並拋出 JobCancelled
+        """
+        if restore:
+            restored, pending = self.restore_cached(jobs, num_inference_steps, guidance_scale, width, height)
+        else:
+            restored, pending = [], list(jobs)
+        output_paths = {id(job): output_path for job, output_path in restored}
+        
+        if pending:
+            names = ", ".join(job["output_name"] for job in pending)
+            logger.info(f"生成 {names}...")
+            for job in pending:
+                self.journal.record_started(job)
             
-            logger.info(f"✅ {page_id} 生成完成: {output_path}")
-            return output_path
+            try:
+                images = self.render_images(pending, num_inference_steps, guidance_scale, width, height)
+                
+                # 保存圖片
+                for job, image in zip(pending, images):
+                    output_path = self.output_dir / f"{job['output_name']}.png"
+                    with self.measure("save"):
+                        image.save(output_path, "PNG", quality=95)
+                        if self.render_cache:
+                            self.render_cache.store(job["cache_key"], output_path)
+                    output_paths[id(job)] = output_path
+                    
+                    if self.render_cache:
+                        self.render_cache.record(job["page_id"], job["variation"], job["cache_key"], job["params"],
+                                                 preview=job.get("preview", False))
+                    
+                    self.journal.record_done(job, output_path)
+                    logger.info(f"✅ {job['output_name']} 生成完成: {output_path}")
+                
+                if self.render_cache:
+                    self.render_cache.save_manifest()
+                if self.metrics:
+                    self.metrics.record_images(len(pending))
+                
+            except JobCancelled:
+                logger.info(f"⏹️ {names} 已取消")
+                for job in pending:
+                    if id(job) not in output_paths:
+                        self.journal.record_cancelled(job)
+                raise
+            except Exception as e:
+                logger.error(f"❌ {names} 生成失敗: {e}")
+                for job in pending:
+                    if id(job) not in output_paths:
+                        self.journal.record_failed(job, e)
+        
+        return [output_paths.get(id(job)) for job in jobs]
+    
+    def render_parallel(self, jobs, workers, batch_size, render_args, desc="生成插圖"):
+        """以多個子程序依頁面分工生成，回傳 {任務名: 路徑}
+
+        子程序以 fork 建立，直接共享已載入的模型權重（寫時複製），
+        每個子程序分到 CPU 核心數 / workers 個 torch 執行緒與等比例的記憶體預算。
+        """
+        global _worker_generator
+        
+        pages = {}
+        for job in jobs:
+            pages.setdefault(job["page_id"], []).append(job)
+        
+        workers = min(workers, len(pages))
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        memory_budget_mb = self.get_memory_budget_mb() // workers
+        batch_size = self.get_batch_size(batch_size, render_args["width"], render_args["height"], memory_budget_mb)
+        
+        logger.info(f"🧵 {workers} 個子程序 × {num_threads} 執行緒，分工 {len(pages)} 頁")
+        
+        _worker_generator = self
+        output_paths = {}
+        context = multiprocessing.get_context("fork")
+        try:
+            with context.Pool(workers, initializer=_init_worker, initargs=(num_threads, memory_budget_mb)) as pool:
+                tasks = [
+                    pool.apply_async(_render_page_jobs, (page_jobs, batch_size, render_args))
+                    for page_jobs in pages.values()
+                ]
+                for task in tqdm(tasks, desc=desc):
+                    paths, throttled, metrics = task.get()
+                    output_paths.update(paths)
+                    # 子程序的節流時間與效能指標一併計入
+                    self.throttle.throttled_seconds += throttled
+                    if self.metrics and metrics:
+                        self.metrics.merge(metrics)
+        finally:
+            _worker_generator = None
+        
+        # 子程序已各自合併寫入 manifest，重新載入最新版本
+        if self.render_cache:
+            self.render_cache.save_manifest()
+        
+        return output_paths
+    
+    def run_jobs(self, jobs, batch_size=None, desc="生成插圖", resume=False, workers=1,
+                 num_inference_steps=25, guidance_scale=7.5, width=None, height=None):
+        """分批執行生成任務，回傳 {page_id: [路徑]}
+
+        resume: 跳過任務日誌中已完成（且參數相同）的任務，只重做缺少或失敗的
+        workers: 大於 1 時以多個子程序依頁面平行生成（僅限CPU）
+        """
+        render_args = dict(
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            width=width,
+            height=height
+        )
+        output_paths = {}
+        throttled_before = self.throttle.throttled_seconds
+        
+        if resume:
+            self.prepare_jobs(jobs, **render_args)
+            completed = self.journal.completed()
+            remaining = []
+            for job in jobs:
+                done_path = completed.get((job["output_name"], job["cache_key"]))
+                if done_path:
+                    output_paths[id(job)] = done_path
+                else:
+                    remaining.append(job)
+            logger.info(f"⏯️ 續跑：{len(jobs) - len(remaining)} 個任務已完成，剩餘 {len(remaining)} 個")
+        else:
+            remaining = jobs
+        
+        # 先取回輸入未變更的圖片，只把需要重新生成的任務分批
+        restored, pending = self.restore_cached(remaining, **render_args)
+        output_paths.update((id(job), output_path) for job, output_path in restored)
+        
+        if workers > 1 and self.device == "cuda":
+            logger.warning("⚠️ CUDA 模式不支援多程序生成，改用單一程序")
+            workers = 1
+        
+        if workers > 1 and pending:
+            paths = self.render_parallel(pending, workers, batch_size, render_args, desc)
+            output_paths.update((id(job), paths.get(job["output_name"])) for job in pending)
+            pending = []
+        
+        batch_size = self.get_batch_size(batch_size, width, height)
+        for start in tqdm(range(0, len(pending), batch_size), desc=desc):
+            batch = pending[start:start + batch_size]
+            paths = self.generate_batch(batch, restore=False, **render_args)
+            output_paths.update((id(job), path) for job, path in zip(batch, paths))
             
-        except Exception as e:
-            logger.error(f"❌ {page_id} 生成失敗: {e}")
-            return None
+            # 只在溫度或負載超過門檻時才暫停
+            self.throttle.wait_if_needed()
+        
+        logger.info(f"🌡️ 本次節流暫停共 {self.throttle.throttled_seconds - throttled_before:.1f} 秒")
+        if self.metrics:
+            self.metrics.export()
+        
+        results = {}
+        for job in jobs:
+            page_results = results.setdefault(job["page_id"], [])
+            if output_paths.get(id(job)):
+                page_results.append(output_paths[id(job)])
+        
+        return results
     
-    def generate_all_images(self, num_variations=3):
-        """生成所有插圖"""
+    def generate_all_images(self, num_variations=3, batch_size=None, resume=False, workers=1):
+        """生成所有插圖
+
+        batch_size: 單次pipeline呼叫的圖片數，可跨頁面合併；None 表示依記憶體預算自動決定
+        resume: 中斷後續跑，跳過任務日誌中已完成的任務
+        workers: 平行生成的子程序數，在多核心CPU上讓吞吐量隨核心數成長
+        """
         if not self.pipeline:
             logger.error("模型未載入，請先運行 load_model()")
             return False
         
         logger.info(f"開始生成 {len(self.prompts)} 個插圖，每個 {num_variations} 個變體...")
         
-        results = {}
+        jobs = [
+            self.make_job(page_id, i + 1)
+            for page_id in self.prompts
+            for i in range(num_variations)
+        ]
+        results = self.run_jobs(jobs, batch_size, resume=resume, workers=workers)
         
-        for page_id, prompt_data in tqdm(self.prompts.items(), desc="生成插圖"):
-            page_results = []
-            
-            for i in range(num_variations):
-                output_path = self.generate_image(
-                    prompt_data["prompt"],
-                    prompt_data["negative"],
-                    f"{page_id}_v{i+1}",
-                    num_inference_steps=25,
-                    guidance_scale=7.5
-                )
-                
-                if output_path:
-                    page_results.append(output_path)
-                
-                # 短暫休息避免過熱
-                time.sleep(1)
-            
-            results[page_id] = page_results
-            
+        for page_id, page_results in results.items():
             if page_results:
                 logger.info(f"✅ {page_id}: 生成 {len(page_results)} 張圖片")
             else:
@@ -208,7 +660,7 @@ class BubbleBookGenerator:
         
         return results
     
-    def generate_single_page(self, page_id, num_variations=3):
+    def generate_single_page(self, page_id, num_variations=3, batch_size=None, resume=False):
         """生成單頁插圖"""
         if page_id not in self.prompts:
             logger.error(f"找不到頁面: {page_id}")
@@ -218,36 +670,181 @@ class BubbleBookGenerator:
             logger.error("模型未載入，請先運行 load_model()")
             return None
         
-        prompt_data = self.prompts[page_id]
-        results = []
-        
-        for i in range(num_variations):
-            output_path = self.generate_image(
-                prompt_data["prompt"],
-                prompt_data["negative"],
-                f"{page_id}_v{i+1}",
-                num_inference_steps=25,
-                guidance_scale=7.5
-            )
-            
-            if output_path:
-                results.append(output_path)
+        jobs = [self.make_job(page_id, i + 1) for i in range(num_variations)]
+        results = self.run_jobs(jobs, batch_size, desc=f"生成 {page_id}", resume=resume)
+        return results.get(page_id, [])
+    
+    def select_previews(self, page_id, candidates, select="sharpness", keep=1):
+        """依規則挑出要放大的預覽，candidates 為 [(任務, 路徑)]"""
+        if callable(select):
+            ranked = select(page_id, candidates)
+        elif select == "first":
+            ranked = candidates
+        elif select == "sharpness":
+            ranked = sorted(candidates, key=lambda item: image_sharpness(item[1]), reverse=True)
+        elif select == "score":
+            ranked = self.rank_by_score({page_id: candidates})[page_id]
+        else:
+            raise ValueError(f"未知的挑選規則: {select}")
+        return ranked[:keep]
+    
+    def record_reuse(self, job, existing, output_path):
+        """以既有圖片作為任務的成品：複製到輸出路徑，並記入輸出庫與任務日誌
+
+        沿用的圖片不是這組生成參數的結果，不能存在任務本身的參數雜湊下（否則之後的一般生成會取回它），
+        而是把沿用圖片的內容雜湊併入參數，另算一個鍵
+        """
+        params = {**job["params"], "reused_from": file_digest(existing)}
+        reuse_job = {**job, "params": params, "cache_key": RenderCache.make_key(params)}
+        if os.path.abspath(output_path) != os.path.abspath(existing):
+            shutil.copyfile(existing, output_path)
+        if self.render_cache:
+            self.render_cache.store(reuse_job["cache_key"], output_path)
+            self.render_cache.record(job["page_id"], job["variation"], reuse_job["cache_key"], params)
+        self.journal.record_done(reuse_job, output_path, source="reuse")
+    
+    def rank_by_score(self, candidates_by_page):
+        """以 variation_selector 的綜合分數排序各頁候選，candidates_by_page 為依頁序的 {page_id: [(任務, 路徑)]}"""
+        scores = score_pages({
+            page_id: [path for _, path in candidates] for page_id, candidates in candidates_by_page.items()
+        })
+        ranked = {}
+        for page_id, candidates in candidates_by_page.items():
+            order = {str(path): rank for rank, (path, _, _) in enumerate(scores.get(page_id, []))}
+            ranked[page_id] = sorted(candidates, key=lambda item: order[str(item[1])])
+        return ranked
+    
+    def generate_with_preview(self, page_ids=None, num_variations=3, select="sharpness", keep=1,
+                              preview_config=None, upscale_config=None, workers=1, reuse_distance=None):
+        """兩階段生成：先為所有變體生成低解析度預覽，只把選中的變體放大到完整解析度
+
+        select: 挑選規則，"sharpness"、"first"、"score"（綜合評分，含相鄰頁面的色彩一致性），或 callable(page_id, [(任務, 路徑)]) 回傳排序後的列表
+        keep: 每頁放大的變體數
+        preview_config / upscale_config: 覆寫 PREVIEW_CONFIG / UPSCALE_CONFIG 中的欄位
+        reuse_distance: 選中的預覽與既有完整解析度圖片的 dHash 距離不超過此值時直接沿用，不再放大；None 表示不沿用
+        """
+        if not self.pipeline:
+            logger.error("模型未載入，請先運行 load_model()")
+            return False
+        
+        preview = {**PREVIEW_CONFIG, **(preview_config or {})}
+        upscale = {**UPSCALE_CONFIG, **(upscale_config or {})}
+        page_ids = page_ids or list(self.prompts)
         
+        # 第一階段：所有變體的低解析度預覽
+        logger.info(f"🔍 預覽 {len(page_ids)} 頁 × {num_variations} 個變體 "
+                    f"({preview['width']}x{preview['height']}, {preview['steps']} 步)")
+        preview_jobs = []
+        for page_id in page_ids:
+            for i in range(num_variations):
+                job = self.make_job(page_id, i + 1)
+                job["output_name"] += "_preview"
+                job["preview"] = True
+                preview_jobs.append(job)
+        
+        preview_results = self.run_jobs(
+            preview_jobs, desc="生成預覽", workers=workers,
+            num_inference_steps=preview["steps"], width=preview["width"], height=preview["height"]
+        )
+        
+        # 第二階段：挑選並以相同種子放大
+        candidates_by_page = {}
+        for page_id in page_ids:
+            generated = set(preview_results.get(page_id, []))
+            candidates_by_page[page_id] = [
+                (job, self.output_dir / f"{job['output_name']}.png")
+                for job in preview_jobs
+                if job["page_id"] == page_id and self.output_dir / f"{job['output_name']}.png" in generated
+            ]
+        if select == "score":
+            # 一次為所有頁面評分，才能比較相鄰頁面
+            ranked = self.rank_by_score(candidates_by_page)
+            select = lambda page_id, candidates: ranked[page_id]
+        
+        artwork_index = None
+        latest_outputs = {}
+        if reuse_distance is not None:
+            artwork_index = ArtworkIndex()
+            artwork_index.scan()
+            artwork_index.save()
+            latest_outputs = self.journal.latest_outputs()
+        
+        final_jobs = []
+        reused = {}
+        for page_id, candidates in candidates_by_page.items():
+            for preview_job, preview_path in self.select_previews(page_id, candidates, select, keep):
+                job = self.make_job(page_id, preview_job["variation"])
+                if upscale["mode"] == "img2img":
+                    job["upscale"] = {
+                        "mode": "img2img",
+                        "strength": upscale["strength"],
+                        "source": preview_job["cache_key"]
+                    }
+                elif upscale["mode"] != "rerender":
+                    raise ValueError(f"未知的放大模式: {upscale['mode']}")
+                
+                if artwork_index is not None:
+                    output_path = self.output_dir / f"{job['output_name']}.png"
+                    self.prepare_jobs([job], upscale["steps"], upscale["guidance"])
+                    # 輸出檔可能是先前以其他提示詞或種子生成的，只有紀錄的參數雜湊相同時才能原地沿用
+                    recorded = latest_outputs.get(str(output_path))
+                    own_current = recorded is not None and recorded.get("key") == job["cache_key"]
+                    existing = artwork_index.reusable(
+                        preview_path, reuse_distance, (IMAGE_WIDTH, IMAGE_HEIGHT),
+                        exclude=() if own_current else (output_path,)
+                    )
+                    if existing:
+                        self.record_reuse(job, existing, output_path)
+                        reused.setdefault(page_id, []).append(output_path)
+                        logger.info(f"♻️ {job['output_name']} 預覽與既有圖片 {existing} 相近，沿用不再放大")
+                        continue
+                
+                if upscale["mode"] == "img2img":
+                    with Image.open(preview_path) as img:
+                        job["init_image"] = img.convert("RGB").resize(
+                            (IMAGE_WIDTH, IMAGE_HEIGHT), Image.Resampling.LANCZOS
+                        )
+                final_jobs.append(job)
+        
+        if reused and self.render_cache:
+            self.render_cache.save_manifest()
+        
+        logger.info(f"⬆️ 放大 {len(final_jobs)} 張選中的變體 ({upscale['mode']})")
+        results = self.run_jobs(final_jobs, desc="放大選中變體", workers=workers,
+                                num_inference_steps=upscale["steps"],
+                                guidance_scale=upscale["guidance"]) if final_jobs else {}
+        for page_id, paths in reused.items():
+            results.setdefault(page_id, []).extend(paths)
         return results
 
-def main():
+def main(argv=None):
     """主函數"""
+    parser = argparse.ArgumentParser(description="《泡泡知道自己在哪裡》插圖生成Pipeline")
+    parser.add_argument("--resume", action="store_true", help="中斷後續跑，跳過任務日誌中已完成的任務")
+    parser.add_argument("--workers", type=int, default=1, help="生成所有插圖時的平行子程序數（CPU）")
+    parser.add_argument("--preview", action="store_true", help="先生成低解析度預覽，只放大每頁最清晰的變體")
+    parser.add_argument("--select-best", action="store_true",
+                        help="自動評分變體，把每頁最佳變體複製到 illustrations/selected（搭配 --preview 時也用於挑選預覽）")
+    parser.add_argument("--reuse-distance", type=int,
+                        help="搭配 --preview：預覽與既有完整圖片的感知雜湊距離不超過此值時直接沿用")
+    parser.add_argument("--metrics", help="匯出效能指標的路徑（.prom 為 Prometheus 格式，其餘為 JSON lines）")
+    args = parser.parse_args(argv)
+    
     print("🎨 《泡泡知道自己在哪裡》插圖生成Pipeline")
     print("=" * 60)
     
-    # 創建生成器
-    generator = BubbleBookGenerator()
-    
-    # 載入模型
-    if not generator.load_model():
+    # 連線常駐服務，或在本程序載入模型
+    generator = get_generator()
+    if generator is None:
         print("❌ 模型載入失敗，請檢查環境設置")
         return False
     
+    if args.metrics:
+        if isinstance(generator, BubbleBookGenerator):
+            generator.metrics = PipelineMetrics(args.metrics)
+        else:
+            print("💡 已連線常駐服務，效能指標請在啟動服務時以 --metrics 指定")
+    
     # 詢問生成模式
     print("\n選擇生成模式:")
     print("1. 生成所有插圖 (13頁)")
@@ -259,7 +856,12 @@ def main():
     if choice == "1":
         # 生成所有插圖
         print("\n🚀 開始生成所有插圖...")
-        results = generator.generate_all_images(num_variations=3)
+        if args.preview:
+            select = "score" if args.select_best else "sharpness"
+            results = generator.generate_with_preview(num_variations=3, select=select, workers=args.workers,
+                                                      reuse_distance=args.reuse_distance)
+        else:
+            results = generator.generate_all_images(num_variations=3, resume=args.resume, workers=args.workers)
         
         if results:
             print("\n🎉 生成完成！")
@@ -273,6 +875,10 @@ def main():
             print(f"  - 成功頁面: {successful_pages}/{len(results)}")
             print(f"  - 總生成圖片: {total_generated}")
             
+            if args.select_best:
+                selected = select_best(results)
+                print(f"🏆 已自動挑選 {len(selected)} 頁的最佳變體: illustrations/selected/")
+            
         else:
             print("❌ 生成失敗")
     
@@ -289,7 +895,7 @@ def main():
             if 0 <= page_choice < len(page_ids):
                 page_id = page_ids[page_choice]
                 print(f"\n🚀 生成 {page_id}...")
-                results = generator.generate_single_page(page_id)
+                results = generator.generate_single_page(page_id, resume=args.resume)
                 
                 if results:
                     print(f"✅ 生成完成: {len(results)} 張圖片")
@@ -306,7 +912,7 @@ def main():
     elif choice == "3":
         # 生成封面
         print("\n🚀 生成封面...")
-        results = generator.generate_single_page("cover")
+        results = generator.generate_single_page("cover", resume=args.resume)
         
         if results:
             print(f"✅ 封面生成完成: {len(results)} 張圖片")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+生成任務日誌
+以追加方式把每個任務的種子、參數與狀態寫入 JSONL，中斷後可據此續跑
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+
+def file_digest(path):
+    """檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JobJournal:
+    """追加式生成任務日誌"""
+
+    def __init__(self, path="illustrations/generated/journal.jsonl"):
+        """初始化日誌"""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, event, job, **fields):
+        """追加一筆紀錄，寫入後立即落盤，避免中斷時遺失"""
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "event": event,
+            "job": job["output_name"],
+            "page_id": job["page_id"],
+            "variation": job["variation"],
+            "seed": job["seed"],
+            "key": job.get("cache_key"),
+            **fields
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record_started(self, job):
+        """記錄任務開始，連同完整生成參數"""
+        self.append("started", job, params=job.get("params"))
+
+    def record_done(self, job, output_path, source="render"):
+        """記錄任務完成，連同輸出檔的內容雜湊，續跑時據此確認檔案仍是這次的成品"""
+        self.append("done", job, output=str(output_path), source=source, digest=file_digest(output_path))
+
+    def record_failed(self, job, error):
+        """記錄任務失敗"""
+        self.append("failed", job, error=str(error))
+
+    def record_cancelled(self, job):
+        """記錄任務被取消"""
+        self.append("cancelled", job)
+
+    def entries(self):
+        """依序讀出所有紀錄"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # 中斷時可能留下半行，略過即可
+                    continue
+
+    def latest_outputs(self):
+        """每個輸出檔最後一筆完成紀錄 {路徑: 紀錄}，即檔案目前內容的來源"""
+        latest = {}
+        for entry in self.entries():
+            if entry["event"] == "done":
+                latest[entry["output"]] = entry
+        return latest
+
+    def completed(self):
+        """回傳最後狀態為完成且檔案仍是該次成品的任務 {(任務名, 參數雜湊): 路徑}
+
+        同一任務不同參數會寫入同一個檔案，因此除了狀態，還要確認檔案內容與完成時記錄的雜湊相同；
+        沒有雜湊的舊紀錄則必須是該檔案最後一筆完成紀錄
+        """
+        latest = {}
+        for entry in self.entries():
+            latest[(entry["job"], entry.get("key"))] = entry
+
+        latest_outputs = self.latest_outputs()
+        digests = {}
+        completed = {}
+        for job_key, entry in latest.items():
+            path = Path(entry["output"]) if entry["event"] == "done" else None
+            if path is None or not path.exists():
+                continue
+            if entry.get("digest"):
+                if entry["output"] not in digests:
+                    digests[entry["output"]] = file_digest(path)
+                if digests[entry["output"]] != entry["digest"]:
+                    continue
+            elif latest_outputs.get(entry["output"]) is not entry:
+                continue
+            completed[job_key] = path
+        return completed
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+生成流程的效能指標
+分段計時、逐步去噪回呼、峰值記憶體與每分鐘出圖數，可匯出為 Prometheus 文字格式或 JSON lines
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+class PipelineMetrics:
+    """生成流程的效能指標收集器"""
+
+    def __init__(self, export_path=None):
+        """初始化收集器
+
+        export_path: 匯出路徑，副檔名為 .prom 時寫成 Prometheus 文字格式，否則追加 JSON lines
+        """
+        self.export_path = Path(export_path) if export_path else None
+        self.started = time.monotonic()
+        # 各執行緒累計被暫停（讓給其他任務）的秒數，從涵蓋暫停的階段與去噪步驟中扣除
+        self.local = threading.local()
+        # 任務佇列的兩個生成執行緒共用同一個收集器
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """清空累計數值"""
+        with self.lock:
+            self.stages = {}
+            self.steps = 0
+            self.step_seconds = 0.0
+            self.images = 0
+            # 已合併的子程序峰值記憶體（RUSAGE_SELF 不含子程序）
+            self.merged_peak_rss_bytes = 0
+
+    def paused_seconds(self):
+        """目前執行緒累計的暫停秒數"""
+        return getattr(self.local, "paused", 0.0)
+
+    @contextmanager
+    def stage(self, name):
+        """量測一個階段的耗時，不含其間的暫停"""
+        start, paused = time.perf_counter(), self.paused_seconds()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start - (self.paused_seconds() - paused))
+
+    @contextmanager
+    def paused(self):
+        """量測讓給其他任務的暫停，計入 preempted 階段，不計入外層階段與去噪步驟"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.local.paused = self.paused_seconds() + seconds
+            self.add_stage("preempted", seconds)
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            stats = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def step_callback(self):
+        """建立 diffusers 的 callback_on_step_end，記錄每一步去噪的耗時（不含步驟之間的暫停）"""
+        last = [time.perf_counter(), self.paused_seconds()]
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            now, paused = time.perf_counter(), self.paused_seconds()
+            with self.lock:
+                self.steps += 1
+                self.step_seconds += now - last[0] - (paused - last[1])
+            last[:] = now, paused
+            return callback_kwargs
+
+        return on_step_end
+
+    def record_images(self, count):
+        """記錄完成的圖片數"""
+        with self.lock:
+            self.images += count
+
+    @staticmethod
+    def peak_rss_bytes():
+        """本程序的峰值常駐記憶體（不含子程序，子程序的峰值由 merge 合併）"""
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 回報 KB，macOS 回報 bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def snapshot(self):
+        """目前的指標"""
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            return {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "pid": os.getpid(),
+                "elapsed_seconds": elapsed,
+                "stages": {name: dict(stats) for name, stats in self.stages.items()},
+                "steps": self.steps,
+                "step_seconds": self.step_seconds,
+                "images": self.images,
+                "images_per_minute": self.images * 60 / elapsed if elapsed > 0 else 0.0,
+                "peak_rss_bytes": max(self.peak_rss_bytes(), self.merged_peak_rss_bytes)
+            }
+
+    def drain(self):
+        """取出目前的指標並清空，供子程序回報給主程序"""
+        with self.lock:
+            snapshot = self.snapshot()
+            self.reset()
+        return snapshot
+
+    def merge(self, snapshot):
+        """合併子程序回報的指標"""
+        with self.lock:
+            for name, stats in snapshot["stages"].items():
+                current = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+                current["calls"] += stats["calls"]
+                current["seconds"] += stats["seconds"]
+                current["max_seconds"] = max(current["max_seconds"], stats["max_seconds"])
+            self.steps += snapshot["steps"]
+            self.step_seconds += snapshot["step_seconds"]
+            self.images += snapshot["images"]
+            self.merged_peak_rss_bytes = max(self.merged_peak_rss_bytes, snapshot["peak_rss_bytes"])
+
+    def to_prometheus(self):
+        """Prometheus 文字格式"""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP bubblebook_stage_seconds_total Time spent in each generation stage.",
+            "# TYPE bubblebook_stage_seconds_total counter"
+        ]
+        for name, stats in snapshot["stages"].items():
+            lines.append(f'bubblebook_stage_seconds_total{{stage="{name}"}} {stats["seconds"]:.6f}')
+        lines += [
+            "# HELP bubblebook_stage_calls_total Number of times each stage ran.",
+            "# TYPE bubblebook_stage_calls_total counter"
+        ]
+        for name, stats in snapshot["stages"].items():
+            lines.append(f'bubblebook_stage_calls_total{{stage="{name}"}} {stats["calls"]}')
+        lines += [
+            "# TYPE bubblebook_denoise_steps_total counter",
+            f"bubblebook_denoise_steps_total {snapshot['steps']}",
+            "# TYPE bubblebook_denoise_step_seconds_total counter",
+            f"bubblebook_denoise_step_seconds_total {snapshot['step_seconds']:.6f}",
+            "# TYPE bubblebook_images_total counter",
+            f"bubblebook_images_total {snapshot['images']}",
+            "# TYPE bubblebook_images_per_minute gauge",
+            f"bubblebook_images_per_minute {snapshot['images_per_minute']:.4f}",
+            "# TYPE bubblebook_peak_rss_bytes gauge",
+            f"bubblebook_peak_rss_bytes {snapshot['peak_rss_bytes']}"
+        ]
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """寫出指標到 export_path"""
+        if self.export_path is None:
+            return
+        self.export_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self.lock:
+            if self.export_path.suffix == ".prom":
+                # 整份覆寫，供 node_exporter textfile collector 讀取；暫存檔名含執行緒編號
+                temp_path = self.export_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                temp_path.write_text(self.to_prometheus(), encoding="utf-8")
+                os.replace(temp_path, self.export_path)
+            else:
+                with open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
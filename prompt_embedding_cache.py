@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+提示詞嵌入快取
+以 (模型, tokenizer, 完整提示詞) 為鍵，保存CLIP文字編碼結果
+記憶體與磁碟兩層，皆以LRU方式淘汰；同一程序的多個生成執行緒可共用
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import torch
+
+
+class PromptEmbeddingCache:
+    """提示詞嵌入快取"""
+
+    def __init__(self, cache_dir="illustrations/cache/embeddings", max_memory_items=256, max_disk_items=4096):
+        """初始化快取
+
+        max_memory_items: 記憶體中最多保留的嵌入數
+        max_disk_items: 磁碟上最多保留的嵌入檔案數
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.memory = OrderedDict()
+        # 任務佇列的兩個生成執行緒共用同一個快取
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name, tokenizer, text):
+        """計算快取鍵"""
+        tokenizer_id = f"{getattr(tokenizer, 'name_or_path', '')}|{len(tokenizer)}|{tokenizer.model_max_length}"
+        digest = hashlib.sha256()
+        for part in (model_name, tokenizer_id, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.pt"
+
+    def get(self, key):
+        """讀取嵌入，找不到時回傳 None"""
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        path = self._disk_path(key)
+        if path.exists():
+            try:
+                embeds = torch.load(path, map_location="cpu", weights_only=True)
+            except Exception:
+                # 損壞的快取檔案直接丟棄
+                path.unlink(missing_ok=True)
+            else:
+                # 更新存取時間，作為磁碟LRU的依據
+                os.utime(path)
+                self._remember(key, embeds)
+                self.hits += 1
+                return embeds
+
+        self.misses += 1
+        return None
+
+    def put(self, key, embeds):
+        """保存嵌入到記憶體與磁碟"""
+        embeds = embeds.detach().cpu()
+        with self.lock:
+            self._remember(key, embeds)
+
+            path = self._disk_path(key)
+            # 暫存檔名含程序與執行緒編號，同時寫入同一個鍵時各自寫自己的暫存檔
+            temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            torch.save(embeds, temp_path)
+            os.replace(temp_path, path)
+            self._evict_disk()
+
+    def _remember(self, key, embeds):
+        self.memory[key] = embeds
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        files = list(self.cache_dir.glob("*.pt"))
+        if len(files) <= self.max_disk_items:
+            return
+
+        files.sort(key=lambda f: f.stat().st_mtime)
+        for path in files[:len(files) - self.max_disk_items]:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+內容定址的插圖輸出庫
+以生成參數的雜湊值保存圖片，並用 manifest 記錄每個 page_id 對應的成品
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能單程序寫入
+    fcntl = None
+
+
+class RenderCache:
+    """內容定址的插圖輸出庫"""
+
+    def __init__(self, root="illustrations/cache/renders"):
+        """初始化輸出庫"""
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / "manifest.json"
+        self.lock_path = self.root / "manifest.lock"
+        self.manifest = self.load_manifest()
+        # 尚未寫回的紀錄，寫回時與磁碟上的版本合併
+        self.updates = {}
+
+    def load_manifest(self):
+        """載入 manifest"""
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {"pages": {}}
+
+    @contextmanager
+    def manifest_lock(self):
+        """跨程序的 manifest 寫入鎖"""
+        with open(self.lock_path, 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save_manifest(self):
+        """把新紀錄合併進磁碟上的 manifest，多個程序同時寫入也不會互相覆蓋"""
+        with self.manifest_lock():
+            manifest = self.load_manifest()
+            for (page_id, name), entry in self.updates.items():
+                manifest["pages"].setdefault(page_id, {})[name] = entry
+
+            temp_path = self.manifest_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.manifest_path)
+
+        self.manifest = manifest
+        self.updates = {}
+
+    @staticmethod
+    def make_key(params):
+        """計算生成參數的雜湊值"""
+        canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def object_path(self, key):
+        """雜湊值對應的圖片檔案"""
+        return self.objects_dir / key[:2] / f"{key}.png"
+
+    def restore(self, key, output_path):
+        """若已有相同輸入的成品，複製到輸出路徑並回傳 True"""
+        object_path = self.object_path(key)
+        if not object_path.exists():
+            return False
+        shutil.copyfile(object_path, output_path)
+        return True
+
+    def store(self, key, image_path):
+        """把剛生成的圖片存入輸出庫"""
+        object_path = self.object_path(key)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = object_path.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(image_path, temp_path)
+        os.replace(temp_path, object_path)
+
+    @staticmethod
+    def entry_name(variation, preview=False):
+        """manifest 中變體的名稱，低解析度預覽另以 _preview 區分，不佔用完整成品的位置"""
+        return f"v{variation}_preview" if preview else f"v{variation}"
+
+    def record(self, page_id, variation, key, params, preview=False):
+        """在 manifest 中記錄 page_id 的成品（需呼叫 save_manifest 寫回）"""
+        entry = {
+            "key": key,
+            "object": str(self.object_path(key).relative_to(self.root)),
+            "params": params
+        }
+        name = self.entry_name(variation, preview)
+        self.manifest["pages"].setdefault(page_id, {})[name] = entry
+        self.updates[(page_id, name)] = entry
+
+    def artifacts(self, page_id, previews=False):
+        """取得某頁所有變體的成品路徑，previews 為 True 時包含低解析度預覽"""
+        page = self.manifest["pages"].get(page_id, {})
+        return {
+            name: self.root / entry["object"]
+            for name, entry in page.items()
+            if previews or not name.endswith("_preview")
+        }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+PDF插圖的縮放快取
+以來源檔案雜湊、目標尺寸與DPI為鍵保存縮放後的圖片，放在工作目錄之外，重建PDF時直接沿用
+"""
+
+import hashlib
+import json
+import os
+import zlib
+from pathlib import Path
+
+from PIL import Image as PILImage
+
+POINTS_PER_INCH = 72
+
+
+def default_cache_dir():
+    """預設快取目錄：$XDG_CACHE_HOME/bubblebook/images"""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "bubblebook" / "images"
+
+
+def image_dhash(img):
+    """圖片的 64 位元 dHash：縮成 9x8 灰階後逐列比較相鄰像素，左邊較亮記為 1"""
+    pixels = img.convert("L").resize((9, 8), PILImage.Resampling.LANCZOS).tobytes()
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = (dhash << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return dhash
+
+
+class ResizedImageCache:
+    """縮放後插圖的持久快取"""
+
+    def __init__(self, cache_dir=None):
+        """初始化快取"""
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # 以 (路徑, 修改時間, 大小) 記住檔案雜湊，未變更的來源不必重新讀檔
+        self.index_path = self.cache_dir / "hash_index.json"
+        self.hash_index = self.load_index()
+        self.index_dirty = False
+
+    def load_index(self):
+        """載入雜湊索引"""
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def save_index(self):
+        """寫回雜湊索引"""
+        if not self.index_dirty:
+            return
+        temp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.hash_index, f)
+        os.replace(temp_path, self.index_path)
+        self.index_dirty = False
+
+    def index_entry(self, image_path):
+        """來源檔案在索引中的紀錄，檔案變更後重新建立"""
+        stat = os.stat(image_path)
+        index_key = os.path.abspath(image_path)
+        entry = self.hash_index.get(index_key)
+        if not entry or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            self.hash_index[index_key] = entry
+            self.index_dirty = True
+        return entry
+
+    def file_hash(self, image_path):
+        """來源檔案的 SHA-256，檔案未變更時從索引取得"""
+        entry = self.index_entry(image_path)
+        if "sha256" not in entry:
+            digest = hashlib.sha256()
+            with open(image_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            entry["sha256"] = digest.hexdigest()
+            self.index_dirty = True
+        return entry["sha256"]
+
+    def perceptual_hash(self, image_path):
+        """來源圖片的 64 位元 dHash 與原始尺寸，檔案未變更時從索引取得"""
+        entry = self.index_entry(image_path)
+        if "dhash" not in entry:
+            with PILImage.open(image_path) as img:
+                entry["dimensions"] = [img.width, img.height]
+                entry["dhash"] = image_dhash(img)
+            self.index_dirty = True
+        return entry["dhash"], tuple(entry["dimensions"])
+
+    @staticmethod
+    def target_pixels(max_width, max_height, dpi):
+        """把版面尺寸（點）換算成指定DPI下的像素"""
+        return (round(max_width / POINTS_PER_INCH * dpi), round(max_height / POINTS_PER_INCH * dpi))
+
+    def get(self, image_path, max_width, max_height, dpi, image_format="flate", quality=None, progressive=False):
+        """取得縮放後的圖片路徑，快取中沒有時才縮放與編碼一次
+
+        image_format: "flate" 保存為無損 PNG，"jpeg" 保存為可直接嵌入PDF的 JPEG
+        quality / progressive: JPEG 的品質與是否漸進式編碼
+        """
+        target_width, target_height = self.target_pixels(max_width, max_height, dpi)
+        source_hash = self.file_hash(image_path)
+        stem = f"{source_hash[:32]}_{target_width}x{target_height}_{dpi}dpi"
+        if image_format == "jpeg":
+            cached_path = self.cache_dir / f"{stem}_q{quality}{'p' if progressive else ''}.jpg"
+        else:
+            cached_path = self.cache_dir / f"{stem}.png"
+
+        if not cached_path.exists():
+            with PILImage.open(image_path) as img:
+                # 計算縮放比例（不放大超過原圖）
+                ratio = min(target_width / img.width, target_height / img.height, 1.0)
+                new_size = (max(1, int(img.width * ratio)), max(1, int(img.height * ratio)))
+                resized_img = img.resize(new_size, PILImage.Resampling.LANCZOS)
+
+                temp_path = cached_path.with_suffix(f".{os.getpid()}.tmp")
+                if image_format == "jpeg":
+                    if resized_img.mode not in ("RGB", "L"):
+                        resized_img = resized_img.convert("RGB")
+                    resized_img.save(temp_path, "JPEG", quality=quality, progressive=progressive, optimize=True)
+                else:
+                    resized_img.save(temp_path, "PNG")
+                os.replace(temp_path, cached_path)
+
+        return str(cached_path)
+
+    def encoded_stream(self, resized_path):
+        """取得縮放後圖片預先編碼好的PDF影像串流 (寬, 高, 色彩空間, 資料, 濾鏡)
+
+        JPEG 原樣以 DCTDecode 嵌入；沒有透明通道的 RGB／灰階 PNG 預先以 Flate 壓縮，
+        其他模式回傳 None，交由 ReportLab 自行編碼
+        """
+        with PILImage.open(resized_path) as img:
+            color_space = {"RGB": "DeviceRGB", "L": "DeviceGray"}.get(img.mode)
+            if color_space is None or "transparency" in img.info:
+                return None
+
+            if img.format == "JPEG":
+                return img.width, img.height, color_space, Path(resized_path).read_bytes(), ("DCTDecode",)
+
+            stream_path = Path(resized_path).with_suffix(".flate")
+            if stream_path.exists():
+                data = stream_path.read_bytes()
+            else:
+                data = zlib.compress(img.tobytes())
+                temp_path = stream_path.with_suffix(f".{os.getpid()}.tmp")
+                temp_path.write_bytes(data)
+                os.replace(temp_path, stream_path)
+
+            return img.width, img.height, color_space, data, ("FlateDecode",)
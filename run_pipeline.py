@@ -90,8 +90,11 @@ def main():
     print("🎨 《泡泡知道自己在哪裡》生圖Pipeline啟動器")
     print("=" * 60)
     
-    # 檢查並安裝套件
-    if not check_and_install_requirements():
+    # 常駐服務已在運行時，本程序只是客戶端，不需要完整的模型環境
+    from generation_client import GenerationClient
+    if GenerationClient().is_available():
+        print("🔌 偵測到常駐生成服務，略過套件檢查")
+    elif not check_and_install_requirements():
         print("❌ 環境準備失敗")
         return False
     
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+逐頁寫出的PDF合併器
+每加入一頁就把該頁的物件寫進檔案並釋放，記憶體用量不隨頁數增加
+"""
+
+import hashlib
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject, NumberObject, StreamObject
+)
+
+# 固定的物件編號：目錄與頁面樹在最後才寫出
+CATALOG_NUM = 1
+PAGES_NUM = 2
+
+
+class StreamingPdfWriter:
+    """把單頁PDF片段依序串流寫成一份文件"""
+
+    def __init__(self, output_path):
+        """開啟輸出檔並寫入檔頭"""
+        self.file = open(output_path, 'wb')
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets = {}
+        self.next_num = PAGES_NUM + 1
+        self.kids = []
+        # 圖片與 form 串流雜湊 -> 已寫出的物件編號，重複出現的插圖與頁面底圖只寫一次
+        self.shared_objects = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def allocate(self):
+        """分配新的物件編號"""
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def write_object(self, num, obj):
+        """寫出一個物件並記錄其位置"""
+        self.offsets[num] = self.file.tell()
+        self.file.write(f"{num} 0 obj\n".encode())
+        obj.write_to_stream(self.file)
+        self.file.write(b"\nendobj\n")
+
+    @classmethod
+    def shared_digest(cls, obj):
+        """圖片或 form 串流連同其引用物件內容的雜湊值，其他物件回傳 None"""
+        if not isinstance(obj, StreamObject) or obj.get("/Subtype") not in ("/Image", "/Form"):
+            return None
+        digest = hashlib.sha256()
+        cls.feed_digest(digest, obj, set())
+        return digest.hexdigest()
+
+    @classmethod
+    def feed_digest(cls, digest, value, visiting):
+        """把物件內容依序餵入雜湊，間接參照展開為所指的物件（與物件編號無關）"""
+        if isinstance(value, IndirectObject):
+            if value.idnum in visiting:
+                digest.update(b"<cycle>")
+                return
+            visiting.add(value.idnum)
+            cls.feed_digest(digest, value.get_object(), visiting)
+            visiting.discard(value.idnum)
+        elif isinstance(value, DictionaryObject):
+            if isinstance(value, StreamObject):
+                digest.update(b"stream%d:" % len(value._data))
+                digest.update(value._data)
+            digest.update(b"<<")
+            for key in sorted(value):
+                if key != "/Length":
+                    digest.update(key.encode())
+                    cls.feed_digest(digest, value[key], visiting)
+            digest.update(b">>")
+        elif isinstance(value, ArrayObject):
+            digest.update(b"[")
+            for item in value:
+                cls.feed_digest(digest, item, visiting)
+            digest.update(b"]")
+        else:
+            digest.update(repr(value).encode() + b" ")
+
+    def add_page(self, fragment_path):
+        """把片段的每一頁連同其引用的物件寫出"""
+        with open(fragment_path, 'rb') as f:
+            reader = PdfReader(f)
+            for page in reader.pages:
+                self.copy_page(page)
+
+    def copy_page(self, page):
+        """重新編號並寫出一頁及其引用的物件"""
+        # 來源物件編號 -> 新物件編號，只在這一頁內有效
+        mapping = {}
+        pending = []
+
+        def remap(value):
+            if isinstance(value, IndirectObject):
+                source_num = value.idnum
+                if source_num not in mapping:
+                    target = value.get_object()
+                    digest = self.shared_digest(target)
+                    if digest and digest in self.shared_objects:
+                        mapping[source_num] = self.shared_objects[digest]
+                    else:
+                        mapping[source_num] = self.allocate()
+                        if digest:
+                            self.shared_objects[digest] = mapping[source_num]
+                        pending.append((mapping[source_num], target))
+                return IndirectObject(mapping[source_num], 0, None)
+            if isinstance(value, StreamObject):
+                copy = EncodedStreamObject()
+                copy._data = value._data
+                for key, item in value.items():
+                    if key != "/Length":
+                        copy[NameObject(key)] = remap(item)
+                return copy
+            if isinstance(value, DictionaryObject):
+                copy = DictionaryObject()
+                for key, item in value.items():
+                    copy[NameObject(key)] = remap(item)
+                return copy
+            if isinstance(value, ArrayObject):
+                return ArrayObject(remap(item) for item in value)
+            return value
+
+        page_num = self.allocate()
+        page_obj = DictionaryObject()
+        for key, item in page.items():
+            if key != "/Parent":
+                page_obj[NameObject(key)] = remap(item)
+        page_obj[NameObject("/Parent")] = IndirectObject(PAGES_NUM, 0, None)
+        self.write_object(page_num, page_obj)
+        self.kids.append(page_num)
+
+        # 依序寫出這一頁引用到的物件，寫完即可釋放
+        while pending:
+            num, target = pending.pop()
+            self.write_object(num, remap(target))
+
+    def close(self):
+        """寫出頁面樹、目錄與交互參照表"""
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(num, 0, None) for num in self.kids),
+            NameObject("/Count"): NumberObject(len(self.kids))
+        })
+        self.write_object(PAGES_NUM, pages)
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(PAGES_NUM, 0, None)
+        })
+        self.write_object(CATALOG_NUM, catalog)
+
+        xref_offset = self.file.tell()
+        self.file.write(f"xref\n0 {self.next_num}\n".encode())
+        self.file.write(b"0000000000 65535 f \n")
+        for num in range(1, self.next_num):
+            self.file.write(f"{self.offsets[num]:010d} 00000 n \n".encode())
+        self.file.write(
+            f"trailer\n<< /Size {self.next_num} /Root {CATALOG_NUM} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+        self.file.close()
@@ -0,0 +1,56 @@
+"""artwork_index 的重複清除不可刪除目前使用中的插圖"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import artwork_index  # noqa: E402
+from job_journal import JobJournal  # noqa: E402
+from render_cache import RenderCache  # noqa: E402
+
+
+def make_job(page_id, variation):
+    return {
+        "page_id": page_id,
+        "variation": variation,
+        "output_name": f"{page_id}_v{variation}",
+        "seed": variation,
+        "cache_key": RenderCache.make_key({"page": page_id, "variation": variation})
+    }
+
+
+def test_gc_keeps_current_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generated = Path("illustrations/generated")
+    generated.mkdir(parents=True)
+    cache = RenderCache("illustrations/cache/renders")
+    journal = JobJournal(generated / "journal.jsonl")
+
+    rng = np.random.default_rng(0)
+    outputs = []
+    for page in range(3):
+        job = make_job(f"page_{page:02d}", 1)
+        output_path = generated / f"{job['output_name']}.png"
+        noise = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+        Image.fromarray(noise).resize((256, 256), Image.Resampling.BICUBIC).save(output_path)
+        # 與生成流程相同：存入輸出庫、記錄 manifest 與日誌
+        cache.store(job["cache_key"], output_path)
+        cache.record(job["page_id"], job["variation"], job["cache_key"], {})
+        journal.record_done(job, output_path)
+        outputs.append(output_path)
+    cache.save_manifest()
+
+    # 目前成品的多餘副本仍可清除
+    stale_copy = generated / "page_00_v1_old.png"
+    stale_copy.write_bytes(outputs[0].read_bytes())
+
+    assert artwork_index.main(["gc", "--delete"])
+
+    for output_path in outputs:
+        assert output_path.exists()
+    assert not stale_copy.exists()
+    assert all(path.exists() for path in artwork_index.render_cache_objects())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+頁面文字的排版快取
+以 (內容, 樣式, 寬度) 為鍵保存斷行後的段落與實際高度，依量測的高度由上而下堆疊，段落不會互相重疊
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+
+from reportlab.platypus import Paragraph
+
+# 量測時允許的最大高度（點），只用來讓段落完整斷行
+MEASURE_HEIGHT = 10000
+
+
+def style_signature(style):
+    """段落樣式的雜湊值，任何屬性改變都會得到不同的值"""
+    attrs = {key: value for key, value in vars(style).items() if key != "parent"}
+    canonical = json.dumps(attrs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def box_padding(style):
+    """有框線或底色的段落在文字框外多佔的高度（上下各一份）"""
+    if not (style.borderWidth or style.backColor):
+        return 0
+    padding = style.borderPadding
+    return max(padding) if isinstance(padding, (list, tuple)) else padding
+
+
+class TextLayoutCache:
+    """斷行結果的 LRU 快取，同一程序中的各本書與各版本共用"""
+
+    def __init__(self, max_items=4096):
+        """初始化快取"""
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def layout(self, text, style, width):
+        """回傳 (已斷行的段落, 佔用高度)，相同的內容、樣式與寬度只量測一次"""
+        key = (text, style_signature(style), width)
+        cached = self.items.get(key)
+        if cached is not None:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        paragraph = Paragraph(text, style)
+        _, height = paragraph.wrap(width, MEASURE_HEIGHT)
+        cached = (paragraph, height + 2 * box_padding(style))
+
+        self.items[key] = cached
+        if len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+        return cached
+
+    def stack(self, canvas, items, x, top, bottom, width):
+        """把 [(文字, 樣式)] 從 top 往下依實際高度堆疊，段落間距為樣式的 spaceAfter
+
+        放不下時先等比例縮小段落間距，仍放不下則印出警告並照樣往下排（段落之間仍不重疊）
+        """
+        layouts = [self.layout(text, style, width) for text, style in items]
+        heights = sum(height for _, height in layouts)
+        gaps = [style.spaceAfter for _, style in items[:-1]] + [0]
+
+        available = top - bottom
+        if heights + sum(gaps) > available and sum(gaps) > 0:
+            scale = max(0.0, (available - heights) / sum(gaps))
+            gaps = [gap * scale for gap in gaps]
+        if heights > available:
+            print(f"⚠️ 文字高度 {heights:.0f}pt 超過可用空間 {available:.0f}pt：{items[0][0]}")
+
+        y = top
+        for (paragraph, height), (_, style), gap in zip(layouts, items, gaps):
+            y -= height
+            paragraph.drawOn(canvas, x, y + box_padding(style))
+            y -= gap
+        return y
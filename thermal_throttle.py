@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+溫度／負載感知的生成節流器
+只在可量測的訊號超過門檻時暫停，健康的運行不會多出任何閒置時間
+"""
+
+import glob
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ThermalThrottle:
+    """依CPU溫度、系統負載與記憶體用量決定是否暫停生成"""
+
+    def __init__(self, max_temp_c=85.0, max_load_per_cpu=None, max_rss_mb=None,
+                 poll_interval=2.0, max_wait=300.0):
+        """初始化節流器
+
+        max_temp_c: CPU溫度上限（攝氏），讀不到溫度時不檢查
+        max_load_per_cpu: 每核心一分鐘平均負載上限，None 表示不檢查
+        max_rss_mb: 本程序常駐記憶體上限 (MB)，None 表示不檢查
+        poll_interval: 超過門檻時每次等待的秒數
+        max_wait: 單次最長等待秒數，避免訊號卡住時永遠不繼續
+        """
+        self.max_temp_c = max_temp_c
+        self.max_load_per_cpu = max_load_per_cpu
+        self.max_rss_mb = max_rss_mb
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.throttled_seconds = 0.0
+        self.throttle_events = 0
+
+    @staticmethod
+    def read_cpu_temp():
+        """讀取 /sys/class/thermal 中最高的溫度，無法讀取時回傳 None"""
+        temps = []
+        for path in glob.glob("/sys/class/thermal/thermal_zone*/temp"):
+            try:
+                with open(path) as f:
+                    temps.append(int(f.read().strip()) / 1000)
+            except (OSError, ValueError):
+                continue
+        return max(temps) if temps else None
+
+    @staticmethod
+    def read_load_per_cpu():
+        """一分鐘平均負載除以核心數"""
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (OSError, AttributeError):
+            return None
+
+    @staticmethod
+    def read_rss_mb():
+        """本程序目前的常駐記憶體 (MB)"""
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def over_limit(self):
+        """回傳超過門檻的原因，皆正常時回傳 None"""
+        if self.max_temp_c is not None:
+            temp = self.read_cpu_temp()
+            if temp is not None and temp > self.max_temp_c:
+                return f"CPU溫度 {temp:.0f}°C > {self.max_temp_c:.0f}°C"
+
+        if self.max_load_per_cpu is not None:
+            load = self.read_load_per_cpu()
+            if load is not None and load > self.max_load_per_cpu:
+                return f"每核心負載 {load:.2f} > {self.max_load_per_cpu:.2f}"
+
+        if self.max_rss_mb is not None:
+            rss = self.read_rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                return f"記憶體 {rss:.0f}MB > {self.max_rss_mb:.0f}MB"
+
+        return None
+
+    def wait_if_needed(self):
+        """訊號超過門檻時等待其回落，回傳本次等待的秒數"""
+        reason = self.over_limit()
+        if reason is None:
+            return 0.0
+
+        logger.warning(f"🌡️ {reason}，暫停生成")
+        self.throttle_events += 1
+        start = time.monotonic()
+
+        while reason is not None and time.monotonic() - start < self.max_wait:
+            time.sleep(self.poll_interval)
+            reason = self.over_limit()
+
+        waited = time.monotonic() - start
+        self.throttled_seconds += waited
+        return waited
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+插圖變體的自動挑選
+把每頁的所有變體縮成小圖後整批以 NumPy 評分：與本書粉彩色盤的距離、清晰度、
+過暗或過曝的懲罰（對應負面提示詞中的 dark），以及與前後頁的色彩相似度，
+把每頁分數最高的變體複製到 illustrations/selected，取代手動挑圖
+"""
+
+import argparse
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+INPUT_DIR = Path("illustrations/generated")
+SELECTED_DIR = Path("illustrations/selected")
+REPORT_NAME = "selection.json"
+
+# 生成圖片的檔名：{page_id}_v{變體編號}.png（預覽圖帶 _preview 後綴，不列入）
+VARIATION_PATTERN = re.compile(r"^(?P<page_id>.+)_v(?P<variation>\d+)$")
+
+# 評分用的縮圖邊長，只需看得出色調與主要輪廓
+SCORE_SIZE = 256
+
+# 本書的粉彩色盤 (RGB)
+PASTEL_PALETTE = np.array([
+    (227, 242, 253),  # 天空藍（封面底色）
+    (187, 222, 251),  # 淺藍
+    (248, 187, 208),  # 粉紅
+    (225, 190, 231),  # 淡紫
+    (200, 230, 201),  # 薄荷綠
+    (255, 249, 196),  # 奶油黃
+    (255, 224, 178),  # 杏色
+    (255, 255, 255)   # 白
+], dtype=np.float32)
+
+# 亮度門檻 (0-255)：低於 DARK_PIXEL 的像素算暗部，平均亮度低於 DARK_MEAN 或高於 BLANK_MEAN 時扣分
+DARK_PIXEL = 60
+DARK_MEAN = 150
+BLANK_MEAN = 250
+
+# 各項分數的權重，每項先在同一頁的變體間正規化到 [0, 1]
+SCORE_WEIGHTS = {"palette": 1.0, "sharpness": 1.0, "brightness": 1.0, "neighbours": 0.5}
+
+
+def load_thumbnails(paths, size=SCORE_SIZE):
+    """讀取圖片並縮成 (N, size, size, 3) 的 float32 陣列"""
+    thumbnails = []
+    for path in paths:
+        with Image.open(path) as img:
+            img.draft("RGB", (size, size))
+            thumbnails.append(np.asarray(img.convert("RGB").resize((size, size), Image.Resampling.BILINEAR)))
+    return np.stack(thumbnails).astype(np.float32)
+
+
+def luminance(batch):
+    """(N, H, W, 3) -> (N, H, W) 的亮度"""
+    return batch @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def palette_distance(batch, palette=PASTEL_PALETTE):
+    """每張圖的像素到色盤中最近顏色的平均距離，越小越符合粉彩配色"""
+    pixels = batch.reshape(batch.shape[0], -1, 3)
+    # 逐色累計最小平方距離，避免建立 (N, 像素, 色數) 的大陣列
+    nearest = np.full(pixels.shape[:2], np.inf, dtype=np.float32)
+    for color in palette:
+        np.minimum(nearest, ((pixels - color) ** 2).sum(axis=-1), out=nearest)
+    return np.sqrt(nearest).mean(axis=1)
+
+
+def sharpness(batch):
+    """每張圖亮度的拉普拉斯變異數，數值越大越清晰"""
+    gray = luminance(batch)
+    laplacian = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+                 - 4 * gray[:, 1:-1, 1:-1])
+    return laplacian.reshape(laplacian.shape[0], -1).var(axis=1)
+
+
+def brightness_penalty(batch):
+    """過暗（暗部比例與平均亮度不足）或近乎空白的懲罰，0 表示沒有問題"""
+    gray = luminance(batch).reshape(batch.shape[0], -1)
+    mean = gray.mean(axis=1)
+    dark_fraction = (gray < DARK_PIXEL).mean(axis=1)
+    too_dark = np.maximum(0, DARK_MEAN - mean) / DARK_MEAN
+    too_blank = np.maximum(0, mean - BLANK_MEAN) / (255 - BLANK_MEAN)
+    return dark_fraction + too_dark + too_blank
+
+
+def color_histograms(batch, bins=4):
+    """每張圖 bins³ 格的正規化色彩直方圖"""
+    n = batch.shape[0]
+    quantized = np.minimum(batch.astype(np.int64) * bins // 256, bins - 1)
+    cells = (quantized[..., 0] * bins + quantized[..., 1]) * bins + quantized[..., 2]
+    offsets = np.arange(n)[:, None, None] * bins ** 3
+    counts = np.bincount((cells + offsets).ravel(), minlength=n * bins ** 3).reshape(n, bins ** 3)
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def normalize(values):
+    """把同一頁各變體的數值線性對應到 [0, 1]，全部相同時為 0"""
+    span = values.max() - values.min()
+    return (values - values.min()) / span if span > 0 else np.zeros_like(values)
+
+
+def score_pages(pages, weights=None):
+    """為各頁變體評分，pages 為依頁序排列的 {page_id: [路徑]}
+
+    回傳 {page_id: [(路徑, 總分, {各項原始數值})]}，依總分由高到低排序
+    """
+    weights = {**SCORE_WEIGHTS, **(weights or {})}
+    page_ids = [page_id for page_id, paths in pages.items() if paths]
+    paths = [path for page_id in page_ids for path in pages[page_id]]
+    if not paths:
+        return {}
+
+    # 所有頁面的變體一次載入、一次計算
+    batch = load_thumbnails(paths)
+    metrics = {
+        "palette": palette_distance(batch),
+        "sharpness": sharpness(batch),
+        "brightness": brightness_penalty(batch)
+    }
+    histograms = color_histograms(batch)
+
+    # 每頁所有變體的平均直方圖，作為相鄰頁面的色彩參考
+    bounds = np.cumsum([0] + [len(pages[page_id]) for page_id in page_ids])
+    page_histograms = [histograms[start:end].mean(axis=0) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    neighbours = np.zeros(len(paths), dtype=np.float64)
+    for index, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        adjacent = [page_histograms[i] for i in (index - 1, index + 1) if 0 <= i < len(page_ids)]
+        if adjacent:
+            # 直方圖交集：與前後頁的平均色彩分布重疊的比例
+            neighbours[start:end] = np.minimum(histograms[start:end, None], np.stack(adjacent)).sum(axis=2).mean(axis=1)
+    metrics["neighbours"] = neighbours
+
+    results = {}
+    for page_id, start, end in zip(page_ids, bounds[:-1], bounds[1:]):
+        page_slice = slice(start, end)
+        total = (weights["palette"] * normalize(-metrics["palette"][page_slice])
+                 + weights["sharpness"] * normalize(np.log1p(metrics["sharpness"][page_slice]))
+                 + weights["brightness"] * normalize(-metrics["brightness"][page_slice])
+                 + weights["neighbours"] * normalize(metrics["neighbours"][page_slice]))
+        ranked = sorted(
+            (
+                (paths[start + i], float(total[i]), {name: float(values[start + i]) for name, values in metrics.items()})
+                for i in range(end - start)
+            ),
+            key=lambda item: item[1], reverse=True
+        )
+        results[page_id] = ranked
+    return results
+
+
+def promote_best(scores, selected_dir=SELECTED_DIR):
+    """把每頁分數最高的變體複製成 selected_dir/{page_id}.png，並寫出評分報告"""
+    selected_dir = Path(selected_dir)
+    selected_dir.mkdir(parents=True, exist_ok=True)
+    selected = {}
+    for page_id, ranked in scores.items():
+        best_path = Path(ranked[0][0])
+        target = selected_dir / f"{page_id}{best_path.suffix}"
+        shutil.copy2(best_path, target)
+        selected[page_id] = target
+
+    report = {
+        page_id: [{"path": str(path), "score": score, "metrics": metrics} for path, score, metrics in ranked]
+        for page_id, ranked in scores.items()
+    }
+    with open(selected_dir / REPORT_NAME, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return selected
+
+
+def select_best(pages, selected_dir=SELECTED_DIR, weights=None):
+    """評分並挑出每頁最佳變體，pages 為 {page_id: [路徑]}（generate_all_images 的回傳值）"""
+    return promote_best(score_pages(pages, weights), selected_dir)
+
+
+def find_variations(input_dir=INPUT_DIR):
+    """依檔名把生成目錄中的圖片分組成 {page_id: [路徑]}，頁面依名稱排序"""
+    pages = {}
+    for path in sorted(Path(input_dir).glob("*.png")):
+        match = VARIATION_PATTERN.match(path.stem)
+        if match:
+            pages.setdefault(match["page_id"], []).append(path)
+    return dict(sorted(pages.items()))
+
+
+def main(argv=None):
+    """主函數"""
+    parser = argparse.ArgumentParser(description="為生成的插圖變體評分，把每頁最佳變體複製到 selected 目錄")
+    parser.add_argument("--input-dir", default=str(INPUT_DIR), help="生成插圖目錄")
+    parser.add_argument("--selected-dir", default=str(SELECTED_DIR), help="挑選結果目錄")
+    args = parser.parse_args(argv)
+
+    print("🏆 插圖變體自動挑選")
+    print("=" * 50)
+
+    pages = find_variations(args.input_dir)
+    if not pages:
+        print(f"❌ {args.input_dir} 中沒有 {{頁面}}_v{{編號}}.png 格式的圖片")
+        return False
+
+    scores = score_pages(pages)
+    selected = promote_best(scores, args.selected_dir)
+    for page_id, ranked in scores.items():
+        best_path, best_score, _ = ranked[0]
+        print(f"✅ {page_id}: {Path(best_path).name}（{best_score:.2f} 分，共 {len(ranked)} 個變體）→ {selected[page_id]}")
+
+    print(f"📁 評分報告：{Path(args.selected_dir) / REPORT_NAME}")
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n\n⏹️ 已取消")
+        sys.exit(1)